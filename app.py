@@ -2,6 +2,14 @@
 # Entry point for the DocQuery Agent Streamlit application.
 # Imports and runs the main UI logic from ui/streamlit_ui.py.
 # To start the app, run: streamlit run app.py
+# To report startup import time and memory, run: python app.py --profile-startup
+
+import sys
+
+if __name__ == '__main__' and '--profile-startup' in sys.argv:
+    # Profile before anything else is imported, so the first stage measures a cold start.
+    from logic.startup_profile import main
+    sys.exit(main())
 
 from ui.streamlit_ui import run_app
 
@@ -0,0 +1,206 @@
+# batch_query.py
+# Headless entry point: asks every question in a questions file against every document in a directory or zip,
+# with bounded concurrency, streaming one JSON line per answer. Rerunning with the same output file resumes where it stopped.
+# Example: python batch_query.py sample_docs questions.txt --output results.jsonl --concurrency 8 --ollama-url http://localhost:11435
+
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx", ".pdf", ".txt")
+FAILURE_MARKERS = ("[Fallback failed]", "Sorry, there was an error")
+
+
+def load_questions(path):
+    """Read questions from a .jsonl file ({"id": ..., "question": ...} per line) or a text file with one per line."""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                questions.append((str(record.get("id", len(questions) + 1)), record["question"]))
+            else:
+                questions.append((str(len(questions) + 1), line))
+    return questions
+
+
+def _named_file(name, data):
+    file = io.BytesIO(data)
+    file.name = name
+    return file
+
+
+def iter_documents(path):
+    """Yield (document key, in-memory file) for each supported document in a directory tree or zip archive.
+
+    Archive members are streamed one at a time under the app's archive limits; duplicate members are skipped.
+    """
+    if zipfile.is_zipfile(path):
+        from logic.archive import iter_archive
+
+        with open(path, "rb") as f:
+            for member, data, reason in iter_archive(f):
+                if reason is None:
+                    yield member, _named_file(os.path.basename(member), data)
+                else:
+                    print(f"Skipping {member}: {reason}", file=sys.stderr)
+        return
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                full_path = os.path.join(root, name)
+                with open(full_path, "rb") as f:
+                    yield os.path.relpath(full_path, path), _named_file(name, f.read())
+
+
+def load_completed(output_path):
+    """Return the (document, question) pairs already answered successfully in a previous run."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short when the previous run was killed
+            if record.get("status") == "ok":
+                completed.add((record["document"], record["question"]))
+    return completed
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ask a fixed set of questions against many documents")
+    parser.add_argument("documents", help="directory or .zip of CSV/XLSX/PDF/TXT documents")
+    parser.add_argument("questions", help="text file with one question per line, or .jsonl with id/question")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=4, help="questions answered in parallel")
+    parser.add_argument("--model", default=None, help="preferred model; falls back like the app does")
+    parser.add_argument("--ollama-url", default=None, help="Ollama server, e.g. a local stub server")
+    parser.add_argument("--no-resume", action="store_true", help="overwrite the output instead of resuming")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="ask the model every time; by default answers cached in the last 24h are reused")
+    args = parser.parse_args(argv)
+
+    if args.ollama_url:
+        # Read by chatbot.ollama_client at import time.
+        os.environ["OLLAMA_URL"] = args.ollama_url
+    from logic.agent_controller import process_file, handle_query
+    from logic.logging_config import log_context
+    from logic.metrics import metrics, METRICS_FILE
+    from logic.parse_cache import content_hash, read_file_bytes
+
+    questions = load_questions(args.questions)
+    if args.no_resume and os.path.exists(args.output):
+        os.remove(args.output)
+    completed = load_completed(args.output)
+    if completed:
+        print(f"Resuming: {len(completed)} answers already in {args.output}", file=sys.stderr)
+
+    write_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(args.concurrency * 2)  # bounds queued work, not just running work
+    latencies = []
+    counts = {"ok": 0, "error": 0, "skipped": len(completed)}
+    output = open(args.output, "a", encoding="utf-8")
+
+    def write(record):
+        with write_lock:
+            if output.closed:
+                return  # an answer still running when a second Ctrl+C stopped the run
+            output.write(json.dumps(record, default=str) + "\n")
+            output.flush()
+            counts[record["status"]] += 1
+            if record["latency_s"] is not None:
+                latencies.append(record["latency_s"])
+
+    def ask(document, doc_type, content, doc_hash, question_id, question):
+        start = time.perf_counter()
+        try:
+            with log_context(request_id=f"{document}#{question_id}"):
+                answer = handle_query(question, content, model=args.model, scope=doc_hash, use_cache=not args.no_cache)
+            status = "error" if answer.startswith(FAILURE_MARKERS) else "ok"
+        except Exception as e:
+            answer, status = f"{type(e).__name__}: {e}", "error"
+        write({
+            "document": document, "doc_type": doc_type, "question_id": question_id, "question": question,
+            "answer": answer, "status": status, "latency_s": round(time.perf_counter() - start, 4),
+            "model": args.model, "timestamp": time.time(),
+        })
+
+    def release(_future):
+        slots.release()
+
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=args.concurrency)
+    interrupted = False
+    try:
+        for document, file in iter_documents(args.documents):
+            pending = [(qid, q) for qid, q in questions if (document, q) not in completed]
+            if not pending:
+                continue
+            doc_type, content = process_file(file)
+            if content is None:
+                for qid, q in pending:
+                    write({
+                        "document": document, "doc_type": doc_type, "question_id": qid, "question": q,
+                        "answer": None, "status": "error", "latency_s": None, "model": args.model,
+                        "timestamp": time.time(),
+                    })
+                continue
+            doc_hash = content_hash(read_file_bytes(file))
+            for qid, q in pending:
+                slots.acquire()
+                pool.submit(ask, document, doc_type, content, doc_hash, qid, q).add_done_callback(release)
+        pool.shutdown(wait=True)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Interrupted; finishing the answers in progress (Ctrl+C again to abandon them).", file=sys.stderr)
+        pool.shutdown(wait=False, cancel_futures=True)
+        try:
+            pool.shutdown(wait=True)
+        except KeyboardInterrupt:
+            pass
+        print("Rerun the same command to resume.", file=sys.stderr)
+    finally:
+        with write_lock:
+            output.close()
+
+    elapsed = time.perf_counter() - started
+    answered = counts["ok"] + counts["error"]
+    ordered = sorted(latencies)
+    print(
+        f"{answered} answers in {elapsed:.1f}s ({answered / elapsed if elapsed else 0:.2f}/s): "
+        f"{counts['ok']} ok, {counts['error']} errors, {counts['skipped']} already done",
+        file=sys.stderr,
+    )
+    print(
+        "latency s: " + "  ".join(f"p{p} {percentile(ordered, p):.3f}" for p in (50, 90, 95, 99))
+        + f"  max {ordered[-1] if ordered else 0:.3f}",
+        file=sys.stderr,
+    )
+    metrics.write_file()
+    print(f"Per-stage metrics written to {METRICS_FILE}", file=sys.stderr)
+    if interrupted:
+        return 130
+    return 0 if counts["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# bench_embedding.py
+# Measures embedding throughput (chunks/sec), peak RSS and index size for the sample_docs corpus scaled up.
+# Run from the repository root: python benchmarks/bench_embedding.py --scale 50 --batch-sizes 32 64 --workers 1 4
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from logic.agent_controller import extract_content  # noqa: E402
+from logic.embedding import BatchedEmbeddings, build_faiss_store, index_nbytes  # noqa: E402
+from logic.retrieval import chunk_content  # noqa: E402
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_docs")
+
+
+def load_sample_chunks():
+    chunks = []
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        if not name.lower().endswith((".csv", ".xlsx", ".pdf", ".txt")):
+            continue
+        with open(os.path.join(SAMPLE_DIR, name), "rb") as f:
+            file = io.BytesIO(f.read())
+        file.name = name
+        content = extract_content(file)
+        if content is not None:
+            chunks.extend(chunk_content(name, content))
+    return chunks
+
+
+def peak_rss_mb():
+    # ru_maxrss is a high-water mark for the whole process, which is why every config runs in its own process.
+    # It is KiB on Linux and bytes on macOS; embedding workers are children.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return (own + children) / scale
+
+
+def run(chunks, batch_size, workers, dtype):
+    embeddings = BatchedEmbeddings(batch_size=batch_size, workers=workers)
+    try:
+        # Warm up so model loading and pool start-up are not counted.
+        embeddings.encode([chunk.page_content for chunk in chunks[:batch_size]])
+        start = time.perf_counter()
+        store = build_faiss_store(chunks, embeddings, dtype=dtype)
+        elapsed = time.perf_counter() - start
+    finally:
+        embeddings.close()
+    return {
+        "batch_size": batch_size,
+        "workers": workers,
+        "dtype": dtype,
+        "chunks": len(chunks),
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(len(chunks) / elapsed, 1),
+        "index_bytes": index_nbytes(store.index),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_isolated(scale, batch_size, workers, dtype):
+    """Run one config in a fresh interpreter so its peak RSS is not inflated by earlier configs."""
+    command = [sys.executable, os.path.abspath(__file__), "--scale", str(scale), "--batch-sizes", str(batch_size),
+               "--workers", str(workers), "--dtypes", dtype, "--single"]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding throughput benchmark")
+    parser.add_argument("--scale", type=int, default=20, help="Times the sample corpus is repeated")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--dtypes", nargs="+", default=["float32", "float16", "int8"])
+    parser.add_argument("--output", help="Optional path to write results as JSON")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # Child process started by run_isolated(): run the one config and print its result as JSON.
+        chunks = load_sample_chunks() * args.scale
+        print(json.dumps(run(chunks, args.batch_sizes[0], args.workers[0], args.dtypes[0])))
+        return
+
+    print(f"Corpus: {len(load_sample_chunks()) * args.scale} chunks (scale {args.scale})")
+    results = []
+    for workers in args.workers:
+        for batch_size in args.batch_sizes:
+            for dtype in args.dtypes:
+                result = run_isolated(args.scale, batch_size, workers, dtype)
+                results.append(result)
+                print(
+                    f"workers={workers:<3} batch={batch_size:<4} dtype={dtype:<8} "
+                    f"{result['chunks_per_sec']:>9} chunks/s  index={result['index_bytes'] / 1024:.0f} KiB  "
+                    f"peak RSS={result['peak_rss_mb']} MB"
+                )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
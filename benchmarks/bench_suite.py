@@ -0,0 +1,259 @@
+# bench_suite.py
+# End-to-end benchmark: parse, classify, index build, context assembly and handle_query latency on synthetic corpora,
+# answered by a local fake Ollama server. Results are written as JSON and compared against a baseline run with per-metric thresholds.
+# Run from the repository root: python benchmarks/bench_suite.py --scale 5 --baseline benchmarks/results/<previous>.json
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ollama import start_server  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# A metric regresses when its median is more than this many times the baseline median.
+THRESHOLDS = {
+    "parse": 1.25,
+    "classify": 1.5,
+    "index_build": 1.25,
+    "context": 1.5,
+    "handle_query": 1.25,
+}
+# Medians below this are treated as equal to it, so sub-millisecond jitter is not reported as a regression.
+NOISE_FLOOR_SECONDS = 0.001
+
+QUESTIONS = {
+    "attendance": ["Who was absent?", "Which students took the most leave and why might that matter?"],
+    "invoice": ["What is the total amount?", "Describe the kinds of items on this invoice."],
+    "pdf": ["What are the payment terms?", "Summarize the obligations of each party."],
+}
+FIRST_NAMES = ["Rahul", "Anjali", "Ramesh", "Priya", "Arjun", "Meera", "Kiran", "Divya", "Suresh", "Lakshmi"]
+ITEMS = ["Pen", "Notebook", "eraser", "Pencil", "Stapler", "Marker", "Ruler", "Folder", "Glue", "Scissors"]
+CONTRACT_WORDS = ["agreement", "party", "payment", "terms", "notice", "clause", "delivery", "invoice", "schedule", "liability"]
+
+
+# --- Synthetic corpora, modelled on sample_docs ------------------------------
+
+def make_attendance_csv(rows, rng):
+    lines = ["Name,Attendance,leave taken,remaining leave "]
+    for i in range(rows):
+        taken = rng.randint(0, 6)
+        lines.append(f"{rng.choice(FIRST_NAMES)} {i},{rng.choice(['Present', 'Absent'])},{taken},{max(0, 6 - taken)}")
+    return "\n".join(lines).encode("utf-8")
+
+
+def make_invoice_csv(rows, rng):
+    lines = ["Item,Price in rupee"]
+    lines.extend(f"{rng.choice(ITEMS)} {i},{rng.randint(5, 500)}" for i in range(rows))
+    return "\n".join(lines).encode("utf-8")
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages, rng, lines_per_page=40):
+    """A minimal multi-page text PDF, written directly so the benchmark needs no PDF library."""
+    objects = {3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    next_id = 4
+    for page in range(pages):
+        lines = [f"Section {page + 1}.{n + 1} " + " ".join(rng.choice(CONTRACT_WORDS) for _ in range(12))
+                 for n in range(lines_per_page)]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        objects[next_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {next_id + 1} 0 R >>")
+        objects[next_id + 1] = f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+        kids.append(next_id)
+        next_id += 2
+    objects[1] = "<< /Type /Catalog /Pages 2 0 R >>"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {len(kids)} >>"
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in range(1, next_id):
+        offsets[obj_id] = len(out)
+        out += f"{obj_id} 0 obj\n{objects[obj_id]}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {next_id}\n0000000000 65535 f \n".encode("ascii")
+    out += "".join(f"{offsets[obj_id]:010d} 00000 n \n" for obj_id in range(1, next_id)).encode("ascii")
+    out += f"trailer\n<< /Size {next_id} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    return bytes(out)
+
+
+def make_corpus(docs_per_kind, scale, pdf_pages, seed):
+    """Return (kind, filename, bytes) triples. A different seed gives different bytes, so every repeat parses cold."""
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(docs_per_kind):
+        corpus.append(("attendance", f"attendance_{seed}_{n}.csv", make_attendance_csv(1000 * scale, rng)))
+        corpus.append(("invoice", f"invoice_{seed}_{n}.csv", make_invoice_csv(500 * scale, rng)))
+        corpus.append(("pdf", f"contract_{seed}_{n}.pdf", make_pdf(pdf_pages, rng)))
+    return corpus
+
+
+# --- Measurement ------------------------------------------------------------
+
+def summarize(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "median_s": round(statistics.median(ordered), 6),
+        "p95_s": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 6),
+        "mean_s": round(statistics.fmean(ordered), 6),
+        "total_s": round(sum(ordered), 6),
+    }
+
+
+def timed(samples, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    samples.append(time.perf_counter() - start)
+    return result
+
+
+def run_suite(args):
+    # Imported after the fake server is up: the Ollama client reads OLLAMA_URL at import time.
+    from logic.agent_controller import extract_content, handle_query
+    from logic.classifier import classify
+    from logic.parser import detect_document_type
+    from logic.parse_cache import parse_cache
+    from logic.table_store import table_store
+    from chatbot.answer_cache import answer_cache
+    from chatbot.query_engine import build_pdf_prompt
+    from chatbot.table_context import build_table_context
+
+    # Keep benchmark artifacts out of the application's caches.
+    scratch = tempfile.mkdtemp(prefix="docquery-bench-")
+    parse_cache.cache_dir = os.path.join(scratch, "parsed")
+    table_store.table_dir = os.path.join(scratch, "tables")
+    answer_cache.path = os.path.join(scratch, "answers.sqlite3")
+
+    create_vectorstore = None
+    index_skipped = "disabled with --skip-index" if args.skip_index else None
+    if not args.skip_index:
+        try:
+            from logic.langchain_pipeline import create_vectorstore
+            from logic.retrieval import chunk_content
+            from logic.index_store import get_embeddings
+            get_embeddings().embed_query("warm up")  # model loading is not part of index build time
+        except Exception as e:
+            create_vectorstore, index_skipped = None, f"{type(e).__name__}: {e}"
+            print(f"Skipping index build: {index_skipped}")
+
+    samples = {name: [] for name in THRESHOLDS}
+    for repeat in range(args.repeat):
+        for kind, filename, data in make_corpus(args.docs, args.scale, args.pdf_pages, seed=repeat):
+            file = io.BytesIO(data)
+            file.name = filename
+            content = timed(samples["parse"], extract_content, file)
+            if content is None:
+                raise RuntimeError(f"failed to parse synthetic document {filename}")
+            if kind == "pdf":
+                timed(samples["classify"], classify, content)
+            else:
+                timed(samples["classify"], detect_document_type, content)
+            if create_vectorstore is not None:
+                chunks = chunk_content(filename, content)
+                timed(samples["index_build"], create_vectorstore, chunks, split=False)
+            for question in QUESTIONS[kind]:
+                if kind == "pdf":
+                    timed(samples["context"], build_pdf_prompt, question, content)
+                else:
+                    timed(samples["context"], build_table_context, content, question)
+                answer = timed(samples["handle_query"], handle_query, question, content)
+                if answer.startswith(("[Fallback failed]", "Sorry, there was an error")):
+                    raise RuntimeError(f"handle_query failed for {filename}: {answer}")
+    shutil.rmtree(scratch, ignore_errors=True)
+    metrics = {name: summarize(values) for name, values in samples.items()}
+    return metrics, index_skipped
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare(metrics, baseline):
+    """Return (metric, baseline median, current median, ratio, regressed) rows for metrics present in both runs."""
+    rows = []
+    for name, threshold in THRESHOLDS.items():
+        current, previous = metrics.get(name), baseline["metrics"].get(name)
+        if not current or not previous:
+            continue
+        ratio = max(current["median_s"], NOISE_FLOOR_SECONDS) / max(previous["median_s"], NOISE_FLOOR_SECONDS)
+        rows.append((name, previous["median_s"], current["median_s"], ratio, ratio > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DocQuery end-to-end benchmark suite")
+    parser.add_argument("--scale", type=int, default=1, help="table rows are 1000x (attendance) and 500x (invoice) this")
+    parser.add_argument("--docs", type=int, default=2, help="documents of each kind per repeat")
+    parser.add_argument("--pdf-pages", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Ollama seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--skip-index", action="store_true", help="skip the embedding/index build stage")
+    parser.add_argument("--output", help="results JSON path (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to check for regressions")
+    args = parser.parse_args()
+
+    server = start_server(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                          answer_tokens=args.answer_tokens)
+    os.environ["OLLAMA_URL"] = server.url
+    started = time.time()
+    metrics, index_skipped = run_suite(args)
+    server.shutdown()
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": started,
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "thresholds": THRESHOLDS,
+        "index_build_skipped": index_skipped,
+        "metrics": metrics,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or int(started)}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'metric':<14}{'n':>6}{'median ms':>12}{'p95 ms':>12}")
+    for name, stats in metrics.items():
+        if stats:
+            print(f"{name:<14}{stats['n']:>6}{stats['median_s'] * 1000:>12.2f}{stats['p95_s'] * 1000:>12.2f}")
+    print(f"Results written to {output}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("config") != results["config"]:
+        print("Warning: baseline was run with a different configuration; ratios may not be comparable.")
+    regressed = False
+    print(f"\nAgainst {args.baseline} (commit {baseline.get('commit')}):")
+    for name, previous, current, ratio, failed in compare(metrics, baseline):
+        regressed |= failed
+        status = f"REGRESSION (limit {THRESHOLDS[name]:.2f}x)" if failed else "ok"
+        print(f"{name:<14}{previous * 1000:>10.2f} -> {current * 1000:>10.2f} ms  {ratio:5.2f}x  {status}")
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
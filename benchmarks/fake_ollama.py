@@ -0,0 +1,137 @@
+# fake_ollama.py
+# Local stand-in for the Ollama HTTP API (/api/tags, /api/chat, /api/generate) with configurable latency and token rate.
+# Used by the batch CLI and benchmarks so answering can be exercised without a real model server.
+# Run from the repository root: python benchmarks/fake_ollama.py --port 11435 --latency 0.2 --tokens-per-second 50
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MODELS = ["llama3", "mistral"]
+ANSWER_WORDS = "Based on the document the answer is shown in the relevant rows and totals above".split()
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, tokens_per_second=0.0, answer_tokens=20, models=None, failure_rate=0.0):
+        super().__init__(address, FakeOllamaHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.models = models or DEFAULT_MODELS
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients that time out or are interrupted hang up mid-answer; that is expected here.
+        pass
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def next_request(self):
+        with self._lock:
+            self.requests += 1
+            return self.requests
+
+    def tokens(self):
+        return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(self.answer_tokens)]
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": name} for name in self.server.models]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        number = self.server.next_request()
+        if self.path not in ("/api/chat", "/api/generate"):
+            self._send_json({"error": "not found"}, status=404)
+            return
+        if request.get("model") not in self.server.models:
+            self._send_json({"error": f"model '{request.get('model')}' not found"}, status=404)
+            return
+        # Deterministic failures: every n-th request fails when failure_rate is 1/n.
+        if self.server.failure_rate and number % max(1, round(1 / self.server.failure_rate)) == 0:
+            self._send_json({"error": "simulated failure"}, status=500)
+            return
+        time.sleep(self.server.latency)
+        tokens = self.server.tokens()
+        delay = 1 / self.server.tokens_per_second if self.server.tokens_per_second else 0.0
+        chat = self.path == "/api/chat"
+
+        def part(text, done):
+            payload = {"model": request["model"], "done": done}
+            if chat:
+                payload["message"] = {"role": "assistant", "content": text}
+            else:
+                payload["response"] = text
+            if done:
+                payload["eval_count"] = len(tokens)
+            return payload
+
+        if not request.get("stream", True):
+            time.sleep(delay * len(tokens))
+            self._send_json(part("".join(tokens), True))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(delay)
+            self.wfile.write(json.dumps(part(token, False)).encode("utf-8") + b"\n")
+            self.wfile.flush()
+        self.wfile.write(json.dumps(part("", True)).encode("utf-8") + b"\n")
+
+
+def start_server(host="127.0.0.1", port=0, **options):
+    """Start a fake server on a background thread; port 0 picks a free port. Returns the server (see .url)."""
+    server = FakeOllamaServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama HTTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="0 for no per-token delay")
+    parser.add_argument("--answer-tokens", type=int, default=20)
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(
+        (args.host, args.port), latency=args.latency, tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens, models=args.models, failure_rate=args.failure_rate,
+    )
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
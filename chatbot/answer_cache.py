@@ -0,0 +1,227 @@
+# answer_cache.py
+# Caches LLM answers keyed by model, normalized question and a hash of the context sent to the model.
+# In-memory LRU with TTL backed by SQLite, plus an optional semantic mode that reuses answers to near-identical questions.
+# Each thread has its own SQLite connection (WAL mode), so the shared lock only guards the in-memory LRU.
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from logic.logging_config import get_logger
+
+ANSWER_CACHE_SIZE = 1024
+ANSWER_CACHE_TTL = 24 * 60 * 60
+# Rows kept on disk; the oldest beyond this are deleted along with expired rows.
+ANSWER_CACHE_MAX_ROWS = 50000
+# Expired and excess rows are purged at most this often, not on every write.
+PURGE_INTERVAL = 10 * 60
+ANSWER_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'answers.sqlite3')
+# Cosine similarity above which a cached answer is reused for a differently worded question.
+SEMANTIC_THRESHOLD = 0.92
+
+llm_logger = get_logger('llm_logger', 'llm')
+error_logger = get_logger('error_logger', 'errors')
+
+
+def normalize_question(question):
+    question = re.sub(r"[^\w\s%.-]", " ", question.lower())
+    return " ".join(question.split()).strip(" .")
+
+
+def context_hash(content):
+    digest = hashlib.sha256()
+    if isinstance(content, pd.DataFrame):
+        digest.update("\x1f".join(map(str, content.columns)).encode("utf-8"))
+        digest.update(pd.util.hash_pandas_object(content, index=False).values.tobytes())
+    else:
+        digest.update(str(content).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _default_embed(text):
+    from logic.index_store import get_embeddings
+    return get_embeddings().embed_query(text)
+
+
+class AnswerCache:
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                 threshold=SEMANTIC_THRESHOLD, embed=_default_embed, max_rows=ANSWER_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.embed = embed
+        self.max_rows = max_rows
+        # key -> {"answer", "created", "model", "scope", "embedding"}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = set()  # paths whose table and indexes exist
+        self._last_purge = 0.0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _connect(self):
+        """Return this thread's connection to the cache database, creating the schema on first use."""
+        db = getattr(self._local, "db", None)
+        if db is not None and self._local.path == self.path:
+            return db
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        with self._schema_lock:
+            if self.path not in self._schema_ready:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS answers ("
+                    "key TEXT PRIMARY KEY, model TEXT, scope TEXT, answer TEXT, created REAL, embedding BLOB)"
+                )
+                db.execute("CREATE INDEX IF NOT EXISTS answers_scope ON answers (model, scope)")
+                db.execute("CREATE INDEX IF NOT EXISTS answers_created ON answers (created)")
+                db.commit()
+                self._schema_ready.add(self.path)
+        self._local.db, self._local.path = db, self.path
+        return db
+
+    @staticmethod
+    def _key(model, question, ctx_hash):
+        return hashlib.sha256(f"{model}\x1f{normalize_question(question)}\x1f{ctx_hash}".encode("utf-8")).hexdigest()
+
+    def _expired(self, created):
+        return time.time() - created > self.ttl
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, model, question, content, scope=None, semantic=False):
+        """Return a cached answer or None.
+
+        scope identifies the documents behind the context (defaults to the context itself); semantic
+        lookups only reuse answers given for the same model and scope.
+        """
+        ctx_hash = context_hash(content)
+        key = self._key(model, question, ctx_hash)
+        try:
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key)
+            if entry is not None and not self._expired(entry["created"]):
+                self._remember(key, entry)
+                self._count("exact_hits")
+                return entry["answer"]
+            if semantic:
+                answer = self._semantic_lookup(model, question, scope or ctx_hash)
+                if answer is not None:
+                    self._count("semantic_hits")
+                    return answer
+        except Exception as e:
+            error_logger.error(f"Error reading answer cache: {e}")
+        self._count("misses")
+        return None
+
+    def _load(self, key):
+        row = self._connect().execute(
+            "SELECT answer, created, model, scope, embedding FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._entry_from_row(row)
+
+    @staticmethod
+    def _entry_from_row(row):
+        answer, created, model, scope, embedding = row
+        return {
+            "answer": answer,
+            "created": created,
+            "model": model,
+            "scope": scope,
+            "embedding": np.frombuffer(embedding, dtype="float32") if embedding else None,
+        }
+
+    def _semantic_lookup(self, model, question, scope):
+        rows = self._connect().execute(
+            "SELECT answer, created, model, scope, embedding FROM answers "
+            "WHERE model = ? AND scope = ? AND embedding IS NOT NULL AND created > ?",
+            (model, scope, time.time() - self.ttl),
+        ).fetchall()
+        if not rows:
+            return None
+        candidates = [self._entry_from_row(row) for row in rows]
+        query = np.asarray(self.embed(normalize_question(question)), dtype="float32")
+        matrix = np.vstack([c["embedding"] for c in candidates])
+        # Embeddings are normalized, so the dot product is the cosine similarity.
+        scores = matrix @ query
+        best = int(np.argmax(scores))
+        if scores[best] >= self.threshold:
+            llm_logger.info(f"Semantic answer cache hit (similarity {scores[best]:.3f}) for: '{question}'")
+            return candidates[best]["answer"]
+        return None
+
+    def put(self, model, question, content, answer, scope=None, semantic=False):
+        ctx_hash = context_hash(content)
+        key = self._key(model, question, ctx_hash)
+        try:
+            # Embedding may load the model on first use; no lock is held meanwhile.
+            embedding = None
+            if semantic:
+                embedding = np.asarray(self.embed(normalize_question(question)), dtype="float32")
+            entry = {"answer": answer, "created": time.time(), "model": model,
+                     "scope": scope or ctx_hash, "embedding": embedding}
+            self._remember(key, entry)
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, entry["scope"], answer, entry["created"],
+                 embedding.tobytes() if embedding is not None else None),
+            )
+            db.commit()
+            self._maybe_purge(db)
+        except Exception as e:
+            error_logger.error(f"Error writing answer cache: {e}")
+
+    def _maybe_purge(self, db):
+        """Delete expired rows and the oldest rows beyond max_rows, at most once per PURGE_INTERVAL."""
+        with self._lock:
+            now = time.time()
+            if now - self._last_purge < PURGE_INTERVAL:
+                return
+            self._last_purge = now
+        db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+        db.execute(
+            "DELETE FROM answers WHERE created < ("
+            "SELECT created FROM answers ORDER BY created DESC LIMIT 1 OFFSET ?)",
+            (self.max_rows - 1,),
+        )
+        db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,119 @@
+# circuit_breaker.py
+# Per-model circuit breakers and rolling latency tracking for Ollama calls.
+# Used by ollama_interface to skip dead models, decide when to hedge, and by the System Info tab to report live state.
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+FAILURE_THRESHOLD = 5
+# Seconds an open breaker waits before letting a single trial request through.
+RESET_TIMEOUT = 30
+LATENCY_WINDOW = 200
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failure_count = 0
+        self.last_failure = None  # (timestamp, message)
+        self.opened_at = None
+        self.successes = 0
+        self.failures = 0
+        self._trial_in_flight = False
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a call to this model may be made now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            self.successes += 1
+            self.failure_count = 0
+            self.state = CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.failure_count += 1
+            self.last_failure = (time.time(), str(error))
+            if self.state == HALF_OPEN or self.failure_count >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.time()
+            self._trial_in_flight = False
+
+    def release(self):
+        """Give up a half-open trial without recording an outcome, e.g. when the caller abandoned the call."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def percentile(self, q):
+        """Return the q-th latency percentile in seconds, or None without samples."""
+        with self._lock:
+            if not self._latencies:
+                return None
+            return float(np.percentile(self._latencies, q))
+
+    def sample_count(self):
+        with self._lock:
+            return len(self._latencies)
+
+    def snapshot(self):
+        with self._lock:
+            state = self.state
+            if state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                state = HALF_OPEN
+            snapshot = {
+                "model": self.name,
+                "state": state,
+                "failure_count": self.failure_count,
+                "threshold": self.failure_threshold,
+                "last_failure": self.last_failure,
+                "successes": self.successes,
+                "failures": self.failures,
+            }
+        for q in (50, 95, 99):
+            snapshot[f"p{q}"] = self.percentile(q)
+        return snapshot
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, model):
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(model)
+            return breaker
+
+    def snapshots(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return [breaker.snapshot() for breaker in breakers]
+
+
+breakers = BreakerRegistry()
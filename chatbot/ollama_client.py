@@ -0,0 +1,113 @@
+# ollama_client.py
+# Shared HTTP client for the Ollama API with connection pooling, consistent timeouts and a TTL-cached model catalogue.
+# Used by ollama_interface and the UI so no request path opens a fresh connection or blocks on model discovery.
+
+import json
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from logic.logging_config import get_logger
+
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434")
+FALLBACK_MODELS = ["llama3", "falcon-7b-instruct", "mistral"]
+POOL_SIZE = 16
+# (connect, read) timeouts in seconds.
+CATALOGUE_TIMEOUT = (2, 3)
+GENERATE_TIMEOUT = (5, 300)
+# The model list is served from memory for this long, then refreshed in the background.
+MODEL_CATALOGUE_TTL = 60
+
+llm_logger = get_logger('llm_logger', 'llm')
+
+
+class OllamaClient:
+    def __init__(self, base_url=OLLAMA_URL, pool_size=POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._models = None
+        self._models_fetched_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _post(self, path, payload, stream=False, timeout=GENERATE_TIMEOUT):
+        response = self.session.post(f"{self.base_url}{path}", json=payload, stream=stream, timeout=timeout)
+        response.raise_for_status()
+        return response
+
+    def generate(self, model, prompt):
+        data = self._post("/api/generate", {"model": model, "prompt": prompt, "stream": False}).json()
+        if "error" in data:
+            raise RuntimeError(data["error"])
+        return data["response"]
+
+    def chat(self, model, messages, timeout=GENERATE_TIMEOUT):
+        data = self._post("/api/chat", {"model": model, "messages": messages, "stream": False}, timeout=timeout).json()
+        if "error" in data:
+            raise RuntimeError(data["error"])
+        return data["message"]["content"]
+
+    def chat_stream(self, model, messages):
+        """Yield the JSON chunks of a streamed chat completion."""
+        with self._post("/api/chat", {"model": model, "messages": messages, "stream": True}, stream=True) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                part = json.loads(line)
+                if "error" in part:
+                    raise RuntimeError(part["error"])
+                yield part
+
+    def list_models(self):
+        response = self.session.get(f"{self.base_url}/api/tags", timeout=CATALOGUE_TIMEOUT)
+        response.raise_for_status()
+        return [model["name"] for model in response.json().get("models", [])]
+
+    def _refresh_models(self):
+        try:
+            models = self.list_models()
+        except Exception as e:
+            llm_logger.warning(f"Error refreshing Ollama model list: {e}")
+            models = None
+        with self._lock:
+            # Keep the last good list if a refresh fails.
+            if models is not None or self._models is None:
+                self._models = models or []
+            self._models_fetched_at = time.monotonic()
+            self._refreshing = False
+
+    def get_models(self):
+        """Return the cached model list, or None if Ollama has not reported any models.
+
+        Only the very first call waits for Ollama; afterwards a stale list is returned immediately
+        while a background thread refreshes it.
+        """
+        with self._lock:
+            first_fetch = self._models is None
+            stale = time.monotonic() - self._models_fetched_at > MODEL_CATALOGUE_TTL
+            if not first_fetch and stale and not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh_models, daemon=True).start()
+        if first_fetch:
+            self._refresh_models()
+        with self._lock:
+            return list(self._models) or None
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url=OLLAMA_URL):
+    """Return the process-wide client for an Ollama server."""
+    with _clients_lock:
+        client = _clients.get(base_url)
+        if client is None:
+            client = _clients[base_url] = OllamaClient(base_url)
+        return client
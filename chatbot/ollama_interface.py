@@ -2,27 +2,37 @@
 # Provides functions and classes to interact with Ollama LLM models, including model selection, fallback, and text generation.
 # Used by the backend and UI to generate answers from AI models and handle model failures gracefully.
 
-import requests
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from logic.logging_config import get_logger
+from logic.metrics import metrics, TOKEN_BUCKETS
+from logic.text_utils import estimate_tokens
+from .circuit_breaker import breakers
+from .ollama_client import get_client, OLLAMA_URL, FALLBACK_MODELS, GENERATE_TIMEOUT
+
+# Overall time budget for one answer across all models, including hedged requests.
+REQUEST_DEADLINE = 180
+# Latency samples a model needs before its p95 is trusted as a hedging trigger.
+HEDGE_MIN_SAMPLES = 20
+
+llm_logger = get_logger('llm_logger', 'llm')
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ollama")
 
 def query_ollama(prompt: str) -> str:
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        json={"model": "llama3", "prompt": prompt}
-    )
-    return response.json()['response']
+    return get_client().generate("llama3", prompt)
 # chatbot/ollama_interface.py
 
-from ollama import chat
-
 def ollama_generate(prompt: str) -> str:
-    response = chat(model="llama3", messages=[{"role": "user", "content": prompt}])
-    return response['message']['content']
+    return get_client().chat("llama3", [{"role": "user", "content": prompt}])
 
 class OllamaModelManager:
-    def __init__(self, ollama_url="http://localhost:11434", fallback_models=None, logger=None):
+    def __init__(self, ollama_url=OLLAMA_URL, fallback_models=None, logger=None):
         self.ollama_url = ollama_url
-        self.fallback_models = fallback_models or ["llama3", "falcon-7b-instruct", "mistral"]
+        self.fallback_models = fallback_models or list(FALLBACK_MODELS)
         self.logger = logger or self._get_default_logger()
+        self.client = get_client(ollama_url)
 
     def _get_default_logger(self):
         import logging
@@ -37,60 +47,167 @@ class OllamaModelManager:
 
     def get_available_models_with_fallback(self):
         """Get available models with fallback options"""
-        try:
-            # Try to get models from Ollama
-            response = requests.get(f"{self.ollama_url}/api/tags", timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                models = [model["name"] for model in data.get("models", [])]
-                if models:
-                    return models
-            # Fallback to predefined models
-            self.logger.warning("Using fallback model list")
-            return self.fallback_models
-        except Exception as e:
-            self.logger.error(f"Error getting models: {e}")
-            return self.fallback_models
+        models = self.client.get_models()
+        if models:
+            return models
+        # Fallback to predefined models
+        self.logger.warning("Using fallback model list")
+        return self.fallback_models
 
 def get_available_models_with_fallback():
     """Get available models with fallback options (standalone function)"""
-    ollama_url = "http://localhost:11434"
-    fallback_models = ["llama3", "falcon-7b-instruct", "mistral"]
-    import logging
-    logger = logging.getLogger("OllamaModelManager")
-    if not logger.handlers:
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-    logger.setLevel(logging.INFO)
+    return OllamaModelManager().get_available_models_with_fallback()
+
+def _models_to_try(model):
+    models_to_try = [model] if model else []
+    return models_to_try + [m for m in FALLBACK_MODELS if m != model]
+
+def _timed_chat(client, model, prompt, deadline):
+    # Outcomes are recorded here rather than by the caller so that hedged calls whose result is
+    # no longer needed still feed the breaker and latency statistics.
+    breaker = breakers.get(model)
+    # The read timeout ends with the answer's deadline, so an abandoned request does not hold an executor worker
+    # for the full GENERATE_TIMEOUT.
+    connect, read = GENERATE_TIMEOUT
+    read = max(min(read, deadline - time.monotonic()), 1)
+    start = time.perf_counter()
     try:
-        response = requests.get(f"{ollama_url}/api/tags", timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            models = [model["name"] for model in data.get("models", [])]
-            if models:
-                return models
-        logger.warning("Using fallback model list")
-        return fallback_models
+        answer = client.chat(model, [{"role": "user", "content": prompt}], timeout=(connect, read))
     except Exception as e:
-        logger.error(f"Error getting models: {e}")
-        return fallback_models
+        breaker.record_failure(e)
+        metrics.inc("llm_requests_total", model=model, outcome="error")
+        llm_logger.warning(f"Model {model} failed: {e}")
+        raise
+    latency = time.perf_counter() - start
+    breaker.record_success(latency)
+    metrics.inc("llm_requests_total", model=model, outcome="ok")
+    metrics.observe("stage_seconds", latency, stage="llm_call", model=model)
+    llm_logger.info(f"Model {model}: answered in {latency:.2f}s")
+    return answer
+
+def _hedge_delay(model):
+    """Seconds to wait on model before hedging to the next one, or None if there is too little history."""
+    breaker = breakers.get(model)
+    if breaker.sample_count() < HEDGE_MIN_SAMPLES:
+        return None
+    return breaker.percentile(95)
 
 def ollama_generate_with_fallback(prompt: str, model: str = None) -> str:
     """
     Try to generate a response using the selected Ollama model. If it fails, fallback to the first available fallback model.
+    Models whose circuit breaker is open are skipped. If the current model is slower than its own p95 latency,
+    a hedged request is sent to the next model and whichever answers first wins. The whole call gives up after
+    REQUEST_DEADLINE seconds.
     """
-    from ollama import chat
-    fallback_models = ["llama3", "falcon-7b-instruct", "mistral"]
-    models_to_try = [model] if model else []
-    models_to_try += [m for m in fallback_models if m != model]
+    client = get_client()
+    candidates = iter(_models_to_try(model))
+    pending = {}  # future -> model
     last_error = None
-    for m in models_to_try:
+    deadline = time.monotonic() + REQUEST_DEADLINE
+    metrics.observe("prompt_tokens", estimate_tokens(prompt), buckets=TOKEN_BUCKETS)
+
+    def launch_next(reason=None):
+        for m in candidates:
+            if breakers.get(m).allow_request():
+                # Run in a copy of the caller's context so the attempt is logged under its request ID.
+                future = _executor.submit(contextvars.copy_context().run, _timed_chat, client, m, prompt, deadline)
+                pending[future] = (m, time.monotonic())
+                if reason:
+                    metrics.inc("llm_fallbacks_total", model=m, reason=reason)
+                return True
+            metrics.inc("llm_breaker_skips_total", model=m)
+            llm_logger.info(f"Skipping model {m}: circuit breaker open")
+        return False
+
+    has_more = launch_next()
+    while pending:
+        newest_model, launched_at = max(pending.values(), key=lambda item: item[1])
+        timeout = deadline - time.monotonic()
+        hedge_delay = _hedge_delay(newest_model) if has_more else None
+        if hedge_delay is not None:
+            timeout = min(timeout, launched_at + hedge_delay - time.monotonic())
+        done, _ = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+        if not done:
+            if time.monotonic() >= deadline:
+                last_error = TimeoutError(f"no answer within {REQUEST_DEADLINE}s from {', '.join(m for m, _ in pending.values())}")
+                break
+            llm_logger.info(f"Model {newest_model} exceeded its p95 latency of {hedge_delay:.2f}s; hedging to next model")
+            has_more = launch_next("hedge")
+            continue
+        for future in done:
+            m, _ = pending.pop(future)
+            try:
+                answer = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            if pending:
+                llm_logger.info(f"Hedged request won by model {m}")
+            return answer
+        if not pending:
+            has_more = launch_next("error")
+    if last_error is None:
+        last_error = "all models are unavailable (circuit breakers open)"
+    metrics.inc("llm_failures_total")
+    return f"[Fallback failed] Error from Ollama: {str(last_error)}"
+
+def ollama_stream_with_fallback(prompt: str, model: str = None):
+    """
+    Stream a response token by token from the selected Ollama model.
+    Falls back to the next model only if the current one fails before producing any token;
+    once tokens have been shown, switching models would mix two different answers.
+    """
+    client = get_client()
+    last_error = None
+    metrics.observe("prompt_tokens", estimate_tokens(prompt), buckets=TOKEN_BUCKETS)
+    for m in _models_to_try(model):
+        breaker = breakers.get(m)
+        if not breaker.allow_request():
+            metrics.inc("llm_breaker_skips_total", model=m)
+            llm_logger.info(f"Skipping model {m}: circuit breaker open")
+            continue
+        if last_error is not None:
+            metrics.inc("llm_fallbacks_total", model=m, reason="error")
+        start = time.perf_counter()
+        first_token_at = None
+        token_count = 0
+        recorded = False
         try:
-            response = chat(model=m, messages=[{"role": "user", "content": prompt}])
-            return response['message']['content']
+            for part in client.chat_stream(m, [{"role": "user", "content": prompt}]):
+                token = part['message']['content']
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        metrics.observe("llm_first_token_seconds", first_token_at - start, model=m)
+                        llm_logger.info(f"Model {m}: time to first token {first_token_at - start:.2f}s")
+                    token_count += 1
+                    yield token
+                if part.get('done'):
+                    # Ollama reports the exact generated token count and duration on the final chunk.
+                    token_count = part.get('eval_count') or token_count
+            breaker.record_success(time.perf_counter() - start)
+            recorded = True
+            metrics.inc("llm_requests_total", model=m, outcome="ok")
+            metrics.observe("stage_seconds", time.perf_counter() - start, stage="llm_call", model=m)
+            elapsed = time.perf_counter() - (first_token_at or start)
+            rate = token_count / elapsed if elapsed > 0 else 0.0
+            llm_logger.info(f"Model {m}: streamed {token_count} tokens in {elapsed:.2f}s ({rate:.1f} tokens/s)")
+            return
         except Exception as e:
+            breaker.record_failure(e)
+            recorded = True
+            metrics.inc("llm_requests_total", model=m, outcome="error")
+            if first_token_at is not None:
+                llm_logger.error(f"Model {m}: stream interrupted after {token_count} tokens: {e}")
+                yield f"\n\n[Stream interrupted] Error from Ollama: {str(e)}"
+                return
+            llm_logger.warning(f"Model {m} failed before producing output, trying next model: {e}")
             last_error = e
-            continue
-    return f"[Fallback failed] Error from Ollama: {str(last_error)}"
+        finally:
+            if not recorded:
+                # The consumer stopped reading mid-stream.
+                breaker.release()
+    if last_error is None:
+        last_error = "all models are unavailable (circuit breakers open)"
+    metrics.inc("llm_failures_total")
+    yield f"[Fallback failed] Error from Ollama: {str(last_error)}"
@@ -2,27 +2,44 @@
 # Provides functions to query data tables and PDF text using LLMs via Ollama, with fallback and error handling.
 # Used by backend logic to answer user questions based on document content.
 
-import ollama
+import contextvars
 import pandas as pd
 import io
-from .ollama_interface import ollama_generate_with_fallback
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logic.logging_config import get_logger
+from logic.metrics import metrics
+from logic.text_utils import estimate_tokens, CHARS_PER_TOKEN
+from .table_context import build_table_context
+from .ollama_interface import ollama_generate_with_fallback, ollama_stream_with_fallback
+
+# Texts longer than this are answered with map-reduce instead of one prompt the model would truncate.
+CONTEXT_WINDOW_TOKENS = 6000
+MAP_CHUNK_TOKENS = 3000
+MAP_CHUNK_OVERLAP_TOKENS = 150
+# Maximum number of chunk prompts in flight at once.
+MAP_CONCURRENCY = 4
+NO_INFO_MARKER = "NO_RELEVANT_INFORMATION"
+
+llm_logger = get_logger('llm_logger', 'llm')
 
 
 def dataframe_to_markdown(df: pd.DataFrame) -> str:
     return df.to_markdown(index=False)
 
-def query_data(question, df, model=None):
-    df_context = dataframe_to_markdown(df)
-    prompt = f"""
+def build_data_prompt(question, df):
+    with metrics.span("context_build", kind="table"):
+        df_context = build_table_context(df, question)
+    return f"""
 You are an intelligent assistant. Below is a document in table format:
 
 {df_context}
 
 Now answer the question: {question}
 """
-    return ollama_generate_with_fallback(prompt, model=model)
-def query_pdf_text(question, extracted_text, model=None):
-    prompt = f"""
+
+def build_pdf_prompt(question, extracted_text):
+    return f"""
 You are a helpful assistant. Here is some content extracted from a PDF document:
 
 {extracted_text}
@@ -31,4 +48,108 @@ Answer the following question clearly based on the document:
 
 Question: {question}
 """
-    return ollama_generate_with_fallback(prompt, model=model)
+
+def build_map_prompt(question, chunk, index, total):
+    return f"""
+You are a helpful assistant. Here is part {index} of {total} of a document:
+
+{chunk}
+
+Using only this part, answer the question below. Quote the relevant facts briefly.
+If this part contains nothing relevant to the question, reply exactly: {NO_INFO_MARKER}
+
+Question: {question}
+"""
+
+def build_reduce_prompt(question, partial_answers):
+    notes = "\n\n".join(f"Notes from part {i}:\n{answer}" for i, answer in partial_answers)
+    return f"""
+You are a helpful assistant. A long document was read in parts, and these notes were taken for the question:
+
+{notes}
+
+Combine the notes into one complete, clear answer. Resolve duplicates and mention any conflicting facts.
+
+Question: {question}
+"""
+
+def split_text_windows(text, window_tokens=MAP_CHUNK_TOKENS, overlap_tokens=MAP_CHUNK_OVERLAP_TOKENS):
+    """Split text into overlapping windows of about window_tokens, preferring to break at line ends."""
+    window = window_tokens * CHARS_PER_TOKEN
+    overlap = overlap_tokens * CHARS_PER_TOKEN
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + window, len(text))
+        if end < len(text):
+            # Break at the last line end in the final fifth of the window, if there is one.
+            newline = text.rfind("\n", start + window * 4 // 5, end)
+            if newline != -1:
+                end = newline + 1
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+def map_partial_answers(question, extracted_text, model=None):
+    """Ask the question of every window concurrently.
+
+    Returns (part number, answer) pairs for the relevant parts, and the failure messages of calls that failed.
+    """
+    chunks = split_text_windows(extracted_text)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=MAP_CONCURRENCY) as executor:
+        # One context copy per window (a context cannot be entered by two threads) keeps the request ID in logs.
+        answers = list(executor.map(
+            lambda item: item[2].run(
+                ollama_generate_with_fallback, build_map_prompt(question, item[1], item[0], len(chunks)), model=model
+            ),
+            [(n, chunk, contextvars.copy_context()) for n, chunk in enumerate(chunks, start=1)],
+        ))
+    llm_logger.info(f"Map phase: {len(chunks)} chunks answered in {time.perf_counter() - start:.2f}s")
+    failures = [answer for answer in answers if answer.startswith("[Fallback failed]")]
+    relevant = [
+        (i, answer) for i, answer in enumerate(answers, start=1)
+        if NO_INFO_MARKER not in answer and not answer.startswith("[Fallback failed]")
+    ]
+    return relevant, failures
+
+def _no_partial_answer(failures):
+    # If any part could not be read, "not found" would be a guess; report the failure so it is not cached as an answer.
+    if failures:
+        llm_logger.info(f"Map phase: {len(failures)} chunks failed and none of the rest had an answer")
+        return failures[0]
+    return "I could not find information about this in the document."
+
+def map_reduce_query(question, extracted_text, model=None):
+    partial_answers, failures = map_partial_answers(question, extracted_text, model=model)
+    if not partial_answers:
+        return _no_partial_answer(failures)
+    return ollama_generate_with_fallback(build_reduce_prompt(question, partial_answers), model=model)
+
+def map_reduce_query_stream(question, extracted_text, model=None):
+    partial_answers, failures = map_partial_answers(question, extracted_text, model=model)
+    if not partial_answers:
+        yield _no_partial_answer(failures)
+        return
+    yield from ollama_stream_with_fallback(build_reduce_prompt(question, partial_answers), model=model)
+
+def _needs_map_reduce(extracted_text):
+    return estimate_tokens(extracted_text) > CONTEXT_WINDOW_TOKENS
+
+def query_data(question, df, model=None):
+    return ollama_generate_with_fallback(build_data_prompt(question, df), model=model)
+
+def query_pdf_text(question, extracted_text, model=None):
+    if _needs_map_reduce(extracted_text):
+        return map_reduce_query(question, extracted_text, model=model)
+    return ollama_generate_with_fallback(build_pdf_prompt(question, extracted_text), model=model)
+
+def query_data_stream(question, df, model=None):
+    return ollama_stream_with_fallback(build_data_prompt(question, df), model=model)
+
+def query_pdf_text_stream(question, extracted_text, model=None):
+    if _needs_map_reduce(extracted_text):
+        return map_reduce_query_stream(question, extracted_text, model=model)
+    return ollama_stream_with_fallback(build_pdf_prompt(question, extracted_text), model=model)
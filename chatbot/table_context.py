@@ -0,0 +1,119 @@
+# table_context.py
+# Builds compact, question-aware prompt context for tables: schema, per-column summary stats and the most relevant rows.
+# Used instead of serializing every row so prompt size stays within a token budget no matter how large the table is.
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from logic.text_utils import estimate_tokens
+
+TABLE_TOKEN_BUDGET = 3000
+TOP_VALUES = 5
+MAX_CELL_CHARS = 60
+STOPWORDS = {
+    "the", "a", "an", "is", "are", "was", "were", "of", "in", "on", "for", "to", "and", "or", "what", "who",
+    "which", "how", "many", "much", "me", "show", "list", "give", "tell", "with", "by", "from", "all", "any",
+    "this", "that", "there", "does", "did", "do", "has", "have", "it", "its", "be", "as", "at",
+}
+
+
+def question_keywords(question):
+    words = re.findall(r"[\w.%-]+", question.lower())
+    return [w for w in dict.fromkeys(words) if len(w) > 1 and w not in STOPWORDS]
+
+
+def _cell(value):
+    if isinstance(value, float) and not pd.isna(value):
+        return f"{value:.6g}"
+    text = "" if pd.isna(value) else str(value).replace("\n", " ").replace("|", "/")
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 1] + "…"
+
+
+def format_rows(df, header=True):
+    """Dense pipe-separated rows, with the header line written once."""
+    lines = ["|".join(_cell(c) for c in df.columns)] if header else []
+    lines.extend("|".join(_cell(v) for v in row) for row in df.itertuples(index=False, name=None))
+    return "\n".join(lines)
+
+
+def summarize_columns(df):
+    lines = []
+    for col in df.columns:
+        series = df[col]
+        non_null = int(series.notna().sum())
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            if non_null:
+                lines.append(
+                    f"- {col} (numeric, {non_null} values): min {series.min():g}, max {series.max():g}, "
+                    f"mean {series.mean():g}, sum {series.sum():g}"
+                )
+            else:
+                lines.append(f"- {col} (numeric, empty)")
+        else:
+            counts = series.dropna().astype(str).value_counts()
+            top = ", ".join(f"{_cell(v)} ({n})" for v, n in counts.head(TOP_VALUES).items())
+            lines.append(f"- {col} (text, {non_null} values, {len(counts)} distinct): {top}")
+    return "\n".join(lines)
+
+
+def score_rows(df, question):
+    """Relevance score per row position: question keywords found in the row, rarer keywords weighing more."""
+    keywords = question_keywords(question)
+    scores = pd.Series(0.0, index=range(len(df)))
+    if not keywords or df.empty:
+        return scores
+    text_columns = [df[col].astype(str).str.lower().reset_index(drop=True) for col in df.columns]
+    for keyword in keywords:
+        hit = np.zeros(len(df), dtype=bool)
+        for values in text_columns:
+            hit |= values.str.contains(keyword, regex=False).to_numpy()
+        matches = int(hit.sum())
+        if matches:
+            # An identifier matching one row should outrank a word matching thousands.
+            scores += hit * np.log1p(len(df) / matches)
+    return scores
+
+
+def build_table_context(df, question="", token_budget=TABLE_TOKEN_BUDGET, name=None):
+    """Serialize a table for a prompt: shape, column stats, then relevant rows until token_budget is spent."""
+    title = f"Table {name}" if name else "Table"
+    parts = [f"{title}: {len(df)} rows x {len(df.columns)} columns", "Columns:", summarize_columns(df)]
+    report = df.attrs.get("load_report")
+    if report and report["sampled"]:
+        # Very large files are loaded as a sample; totals over the whole file come from the loader.
+        parts[0] += f" (random sample of {report['rows_total']} rows)"
+        parts.append("Full-file column totals:")
+        parts.extend(
+            f"- {col}: {stats['count']} values" + (
+                f", min {stats['min']:g}, max {stats['max']:g}, sum {stats['sum']:g}" if "sum" in stats else ""
+            ) + (
+                f" (partial: {stats['non_numeric']} non-numeric values excluded)" if stats.get("partial") else ""
+            )
+            for col, stats in report["summary"].items()
+        )
+    used = estimate_tokens("\n".join(parts))
+
+    scores = score_rows(df, question)
+    matching = scores[scores > 0].sort_values(ascending=False, kind="stable").index
+    # Matching rows first, then the remaining rows in their original order.
+    order = list(matching) + list(np.flatnonzero(scores.to_numpy() == 0))
+
+    header = format_rows(df.iloc[0:0])
+    used += estimate_tokens(header)
+    selected = []
+    for position in order:
+        line = format_rows(df.iloc[position:position + 1], header=False)
+        tokens = estimate_tokens(line) + 1
+        if used + tokens > token_budget:
+            break
+        selected.append(line)
+        used += tokens
+
+    if selected:
+        label = f"Rows ({len(matching)} match the question)" if len(matching) else "Rows"
+        parts.extend([f"{label}:", header, *selected])
+    if len(selected) < len(df):
+        parts.append(f"... {len(df) - len(selected)} more rows not shown; use the column stats above for totals.")
+    return "\n".join(parts)
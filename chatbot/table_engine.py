@@ -0,0 +1,308 @@
+# table_engine.py
+# Answers common aggregate and filter questions about attendance and invoice tables with vectorized pandas operations.
+# Used before the LLM so questions like totals, counts, percentages and "who was absent" are answered exactly and instantly.
+
+import re
+
+import pandas as pd
+
+PRESENT_VALUES = {"p", "present"}
+ABSENT_VALUES = {"a", "absent"}
+# Share of non-empty values that must look like a status/percentage for a column to be treated as one.
+COLUMN_MATCH_RATIO = 0.8
+DEFAULT_ATTENDANCE_THRESHOLD = 75
+MAX_LISTED = 50
+
+_THRESHOLD_BELOW = re.compile(r"(?:below|under|less than|lower than|<)\s*(\d+(?:\.\d+)?)")
+_THRESHOLD_ABOVE = re.compile(r"(?:above|over|more than|greater than|higher than|>)\s*(\d+(?:\.\d+)?)")
+_NUMBER = re.compile(r"[^\d.\-]")
+
+# A question only goes to a table's engine if it uses that document type's vocabulary, names one of its columns or
+# mentions one of its rows; anything else (or about another document) is left to the LLM.
+ATTENDANCE_TERMS = (
+    "attendance", "attend", "attended", "present", "absent", "absentee", "defaulter", "shortage",
+    "student", "employee", "pupil", "lecture", "class",
+)
+INVOICE_TERMS = (
+    "invoice", "bill", "price", "priced", "cost", "costliest", "expensive", "cheap", "cheapest", "item", "product",
+    "amount", "grand total", "subtotal", "spend", "spent", "paid", "purchase", "mrp", "quantity", "qty",
+)
+_HIGHEST = ("most expensive", "highest", "maximum", "max", "costliest", "best")
+_LOWEST = ("cheapest", "lowest", "minimum", "min", "least expensive", "worst")
+
+
+def _words(question):
+    return re.findall(r"[\w.%-]+", question.lower())
+
+
+def _phrases(question, max_words=4):
+    """All word n-grams of the question, used to find names or items it mentions."""
+    words = _words(question)
+    return {" ".join(words[i:i + n]) for n in range(1, max_words + 1) for i in range(len(words) - n + 1)}
+
+
+def _term_pattern(term):
+    # Terms match whole words, allowing a plural ending, so "sum" does not match "summarize".
+    start = r"(?<!\w)" if term[0].isalnum() else ""
+    end = r"(?:e?s)?(?!\w)" if term[-1].isalnum() else ""
+    return start + re.escape(term) + end
+
+
+def _has_any(question, *terms):
+    return any(re.search(_term_pattern(term), question) for term in terms)
+
+
+def _to_numeric(series):
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return pd.to_numeric(series.astype(str).str.replace(_NUMBER, "", regex=True), errors="coerce")
+
+
+def _format_list(values):
+    values = [str(v) for v in values]
+    if not values:
+        return "none"
+    if len(values) > MAX_LISTED:
+        return ", ".join(values[:MAX_LISTED]) + f" and {len(values) - MAX_LISTED} more"
+    return ", ".join(values)
+
+
+def _format_number(value):
+    return f"{value:,.2f}".rstrip("0").rstrip(".")
+
+
+def _find_column(df, *keywords):
+    """First column whose name contains one of the keywords as a whole word ("rate" does not match "Separate")."""
+    for col in df.columns:
+        name = str(col).lower()
+        if any(re.search(_term_pattern(key), name) for key in keywords):
+            return col
+    return None
+
+
+def _mentions_column(df, question):
+    """Whether the question names one of the table's columns."""
+    return bool(_named_columns(df, question))
+
+
+def _named_columns(df, question):
+    """Columns whose name appears in the question as whole words."""
+    return [col for col in df.columns
+            if len(str(col).strip()) > 2 and not str(col).lower().startswith("unnamed")
+            and re.search(_term_pattern(str(col).lower().strip()), question)]
+
+
+def _fits(question, df, terms):
+    return _has_any(question, *terms) or _mentions_column(df, question)
+
+
+def _mentioned_rows(labels, question):
+    """Boolean mask of rows whose label appears as a phrase in the question."""
+    return labels.str.lower().str.strip().isin(_phrases(question))
+
+
+# --- Attendance -------------------------------------------------------------
+
+def _status_columns(df):
+    columns = []
+    for col in df.columns:
+        values = df[col].dropna().astype(str).str.strip().str.lower()
+        if len(values) and values.isin(PRESENT_VALUES | ABSENT_VALUES).mean() >= COLUMN_MATCH_RATIO:
+            columns.append(col)
+    return columns
+
+
+def _percentage_column(df):
+    named = _find_column(df, "%", "percent")
+    if named is not None and _to_numeric(df[named]).notna().any():
+        return named
+    # Sheets with two header rows put the "%" label in the data, so look at the values instead.
+    for col in df.columns:
+        values = df[col].dropna().astype(str).str.strip()
+        if len(values) and values.str.endswith("%").mean() >= COLUMN_MATCH_RATIO:
+            return col
+    return None
+
+
+def _name_column(df, exclude):
+    named = _find_column(df, "name", "student", "employee")
+    if named is not None:
+        return named
+    for col in df.columns:
+        if col not in exclude and not pd.api.types.is_numeric_dtype(df[col]):
+            return col
+    return df.columns[0]
+
+
+def answer_attendance_question(question, df):
+    q = question.lower()
+    status_cols = _status_columns(df)
+    pct_col = _percentage_column(df)
+    if not status_cols and pct_col is None:
+        return None
+    name_col = _name_column(df, exclude=set(status_cols) | {pct_col})
+    names = df[name_col].astype(str).str.strip()
+
+    if status_cols:
+        statuses = df[status_cols].apply(lambda col: col.astype(str).str.strip().str.lower())
+        present = statuses.isin(PRESENT_VALUES)
+        absent = statuses.isin(ABSENT_VALUES)
+        marked = present | absent
+        # Per-person rate from the status columns; used when the sheet has no percentage column.
+        rate = present.sum(axis=1) / marked.sum(axis=1).where(lambda n: n > 0) * 100
+        latest = status_cols[-1]
+        on_day = f" on {latest}" if len(status_cols) > 1 else ""
+        is_present = present[latest]
+        is_absent = absent[latest]
+    if pct_col is not None:
+        rate = _to_numeric(df[pct_col])
+    valid = names.ne("") & names.str.lower().ne("nan") & (rate.notna() if not status_cols else marked.any(axis=1))
+
+    mentioned = _mentioned_rows(names, q) & valid
+    if not mentioned.any() and not _fits(q, df, ATTENDANCE_TERMS):
+        return None
+    if mentioned.any():
+        lines = []
+        for i in mentioned[mentioned].index:
+            parts = []
+            if status_cols:
+                parts.append("present" if is_present[i] else "absent" if is_absent[i] else "not marked")
+            # A single status column only says whether someone was present, not a meaningful rate.
+            if pd.notna(rate[i]) and (pct_col is not None or len(status_cols) > 1):
+                parts.append(f"attendance {_format_number(rate[i])}%")
+            lines.append(f"{names[i]}: {', '.join(parts)}{on_day if status_cols else ''}")
+        return "\n".join(lines)
+
+    if _has_any(q, *_HIGHEST, *_LOWEST):
+        # A single status column gives everyone 0% or 100%, which has no meaningful maximum.
+        ranked = rate[valid].dropna()
+        if ranked.empty or (pct_col is None and len(status_cols) < 2):
+            return None
+        lowest = _has_any(q, *_LOWEST)
+        best = ranked.min() if lowest else ranked.max()
+        who = names[ranked.index[ranked == best]]
+        return f"The {'lowest' if lowest else 'highest'} attendance is {_format_number(best)}%: {_format_list(who)}"
+
+    below = _THRESHOLD_BELOW.search(q)
+    above = _THRESHOLD_ABOVE.search(q)
+    if below or above or _has_any(q, "defaulter", "shortage"):
+        if below:
+            threshold = float(below.group(1))
+            selected = valid & (rate < threshold)
+            relation = "below"
+        elif above:
+            threshold = float(above.group(1))
+            selected = valid & (rate > threshold)
+            relation = "above"
+        else:
+            threshold = DEFAULT_ATTENDANCE_THRESHOLD
+            selected = valid & (rate < threshold)
+            relation = "below"
+        count = int(selected.sum())
+        return (f"{count} of {int(valid.sum())} have attendance {relation} {_format_number(threshold)}%: "
+                f"{_format_list(names[selected])}")
+
+    wants_count = _has_any(q, "how many", "count", "number of", "total number")
+    asks_rate = _has_any(q, "percentage", "percent", "%", "rate", "average attendance")
+    if status_cols and (_has_any(q, "absent", "present") or ("attend" in q and not asks_rate)):
+        if "absent" in q:
+            selected, label = valid & is_absent, "absent"
+        else:
+            selected, label = valid & is_present, "present"
+        count = int(selected.sum())
+        if wants_count:
+            return f"{count} of {int(valid.sum())} were {label}{on_day}."
+        return f"{label.capitalize()}{on_day} ({count}): {_format_list(names[selected])}"
+
+    if asks_rate:
+        overall = rate[valid].mean()
+        if pd.isna(overall):
+            return None
+        return f"Average attendance is {_format_number(overall)}% across {int(valid.sum())} people."
+
+    if wants_count and _has_any(q, "student", "employee", "people", "person", "record", "row"):
+        return f"There are {int(valid.sum())} records."
+    return None
+
+
+# --- Invoice ----------------------------------------------------------------
+
+def answer_invoice_question(question, df):
+    q = question.lower()
+    price_col = _find_column(df, "price", "cost", "rate", "rupee", "amount", "total", "mrp")
+    if price_col is None:
+        return None
+    prices = _to_numeric(df[price_col])
+    if prices.notna().sum() == 0:
+        return None
+    item_col = _find_column(df, "item", "product", "description", "particular", "name")
+    if item_col is None:
+        item_col = next((c for c in df.columns if c != price_col and not pd.api.types.is_numeric_dtype(df[c])), None)
+    items = df[item_col].astype(str).str.strip() if item_col is not None else pd.Series(df.index.astype(str), index=df.index)
+    qty_col = _find_column(df, "qty", "quantity", "units")
+    amount_col = _find_column(df, "line total", "amount", "subtotal")
+    if amount_col is not None and amount_col != price_col:
+        line_totals = _to_numeric(df[amount_col])
+    elif qty_col is not None:
+        line_totals = prices * _to_numeric(df[qty_col]).fillna(1)
+    else:
+        line_totals = prices
+    # Questions about quantities aggregate the quantity column; ones naming any other column (dates, tax, ...) are
+    # left to the LLM rather than answered with prices.
+    named = _named_columns(df, q)
+    if qty_col is not None and (qty_col in named or _has_any(q, "qty", "quantity", "units")):
+        values, label = _to_numeric(df[qty_col]), "quantity"
+    elif any(col not in (price_col, amount_col, item_col) for col in named):
+        return None
+    else:
+        values, label = prices, None
+    valid = values.notna()
+
+    mentioned = _mentioned_rows(items, q) & valid
+    if not mentioned.any() and not _fits(q, df, INVOICE_TERMS):
+        return None
+    if mentioned.any() and not _has_any(q, "total amount", "grand total", "sum of all"):
+        prefix = f"{label} " if label else ""
+        return "\n".join(f"{items[i]}: {prefix}{_format_number(values[i])}" for i in mentioned[mentioned].index)
+
+    if _has_any(q, *_HIGHEST, *_LOWEST):
+        lowest = _has_any(q, *_LOWEST)
+        i = values[valid].idxmin() if lowest else values[valid].idxmax()
+        if label:
+            return f"The {'lowest' if lowest else 'highest'} {label} is {items[i]} with {_format_number(values[i])}."
+        return f"The {'cheapest' if lowest else 'most expensive'} item is {items[i]} at {_format_number(values[i])}."
+    if _has_any(q, "average", "mean"):
+        return f"The average {label or 'price'} is {_format_number(values[valid].mean())} across {int(valid.sum())} items."
+
+    below = _THRESHOLD_BELOW.search(q)
+    above = _THRESHOLD_ABOVE.search(q)
+    if below or above:
+        threshold = float((below or above).group(1))
+        selected = valid & ((values < threshold) if below else (values > threshold))
+        relation = "below" if below else "above"
+        described = f"with {label}" if label else "priced"
+        return (f"{int(selected.sum())} items {described} {relation} {_format_number(threshold)}: "
+                f"{_format_list(items[selected])}")
+
+    if _has_any(q, "how many item", "number of item", "count", "how many product"):
+        return f"There are {int(valid.sum())} items."
+    if label and _has_any(q, "total", "sum", "overall"):
+        return f"The total {label} is {_format_number(values[valid].sum())} across {int(valid.sum())} items."
+    if _has_any(q, "total", "sum", "overall amount", "invoice amount", "grand"):
+        return f"The total amount is {_format_number(line_totals[valid].sum())} across {int(valid.sum())} items."
+    return None
+
+
+def answer_table_question(question, df, doc_type):
+    """Return an exact answer computed from the table, or None if the question needs the LLM."""
+    if df is None or df.empty:
+        return None
+    try:
+        if doc_type == "attendance":
+            return answer_attendance_question(question, df)
+        if doc_type == "invoice":
+            return answer_invoice_question(question, df)
+    except (KeyError, ValueError, TypeError):
+        # Unusual layouts fall through to the LLM rather than failing the question.
+        return None
+    return None
@@ -2,71 +2,147 @@
 # Core backend logic for file processing, document classification, query routing, and error handling in DocQuery Agent.
 # Handles integration with document loaders, parsers, and chatbot engines. Logs all major system events and errors.
 
-from .document_loader import load_document
+import contextvars
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .document_loader import load_document, load_table, load_text, SUPPORTED_EXTENSIONS
 from .parser import detect_document_type
-from chatbot.query_engine import query_data, query_pdf_text
+from .classifier import classify
+from chatbot.query_engine import query_data, query_pdf_text, query_data_stream, query_pdf_text_stream, NO_INFO_MARKER
+from chatbot.answer_cache import answer_cache
+from chatbot.table_engine import answer_table_question
 from logic.logging_config import get_logger
+from logic.metrics import metrics
+from logic.parse_cache import parse_cache, read_file_bytes, cache_key
 import pandas as pd
-import pdfplumber
-import io
 
 upload_logger = get_logger('upload_logger', 'upload')
 classification_logger = get_logger('classification_logger', 'classification')
 error_logger = get_logger('error_logger', 'errors')
 user_actions_logger = get_logger('user_actions_logger', 'user_actions')
 
+# Fan-out mode asks the question of each document separately; this many documents are answered at once.
+FANOUT_CONCURRENCY = 4
+# Seconds a document may take, counted from when its answer starts, before it is reported as timed out.
+FANOUT_DOCUMENT_TIMEOUT = 120
+FANOUT_POLL_SECONDS = 0.5
+# A per-document answer containing one of these says the document does not cover the question; it is not a conflict.
+NO_ANSWER_PHRASES = (
+    NO_INFO_MARKER.lower(),
+    "could not find information",
+    "don't have enough information",
+    "do not have enough information",
+    "no information about",
+)
+
 
 def process_file(file):
     filename = file.name.lower()
     upload_logger.info(f"Processing file: {filename}")
     try:
-        if filename.endswith(".csv"):
-            df = pd.read_csv(file)
-            doc_type = detect_document_type(df)
-            classification_logger.info(f"Detected document type: {doc_type} for file: {filename}")
-            return doc_type, df
-        elif filename.endswith(".xlsx"):
-            df = pd.read_excel(file)
-            doc_type = detect_document_type(df)
-            classification_logger.info(f"Detected document type: {doc_type} for file: {filename}")
-            return doc_type, df
-        elif filename.endswith(".pdf"):
-            with pdfplumber.open(file) as pdf:
-                all_text = ""
-                for page in pdf.pages:
-                    all_text += page.extract_text() + "\n"
-            upload_logger.info(f"Extracted text from PDF file: {filename}")
-            return "pdf_text", all_text
-        else:
+        if not filename.endswith(SUPPORTED_EXTENSIONS):
             error_logger.warning(f"Unknown file type for file: {filename}")
             return "unknown", None
+        content = parse_file_cached(file)
+        if isinstance(content, pd.DataFrame):
+            doc_type = detect_document_type(content)
+            classification_logger.info(f"Detected document type: {doc_type} for file: {filename}")
+            return doc_type, content
+        upload_logger.info(f"Extracted text from file: {filename}")
+        return ("pdf_text" if file_kind(filename) == "pdf" else "text"), content
     except Exception as e:
         error_logger.error(f"Error processing file {filename}: {e}")
         return "error", None
 
-def handle_query(question, content, model=None):
+def _cached_answer(question, content, model, scope, semantic_cache):
+    answer = answer_cache.get(model or "default", question, content, scope=scope, semantic=semantic_cache)
+    if answer is not None:
+        user_actions_logger.info(f"Answer cache hit for query: '{question}'")
+    return answer
+
+def _store_answer(question, content, model, answer, scope, semantic_cache):
+    # Never cache model failures; the next attempt may succeed.
+    if answer.strip() and "[Fallback failed]" not in answer and "[Stream interrupted]" not in answer:
+        answer_cache.put(model or "default", question, content, answer, scope=scope, semantic=semantic_cache)
+
+def handle_query(question, content, model=None, scope=None, semantic_cache=False, use_cache=True):
+    """Answer a question about one document. use_cache=False always asks the model, then caches the fresh answer."""
     user_actions_logger.info(f"Handling query: '{question}'")
     try:
         if isinstance(content, pd.DataFrame):
             if content.empty:
                 error_logger.warning("Query on empty DataFrame.")
                 return "This document is empty. Please upload a valid file."
-            return query_data(question, content, model=model)
+            answer = answer_table_question(question, content, detect_document_type(content))
+            if answer is not None:
+                metrics.inc("answers_total", source="table")
+                return answer
+            query = query_data
         elif isinstance(content, str):
             if not content.strip():
                 error_logger.warning("Query on empty text content.")
                 return "This document is empty. Please upload a valid file."
-            return query_pdf_text(question, content, model=model)
+            query = query_pdf_text
         else:
             error_logger.error("Unsupported document format for query.")
             return "Unsupported document format."
+        answer = _cached_answer(question, content, model, scope, semantic_cache) if use_cache else None
+        if answer is None:
+            answer = query(question, content, model=model)
+            _store_answer(question, content, model, answer, scope, semantic_cache)
+            metrics.inc("answers_total", source="llm")
+        else:
+            metrics.inc("answers_total", source="cache")
+        return answer
     except Exception as e:
         error_logger.error(f"Error processing query: {e}")
         return f"Sorry, there was an error processing your question: {e}"
 
-def handle_uploaded_file(uploaded_file):
+def handle_query_stream(question, content, model=None, scope=None, semantic_cache=False):
+    """Like handle_query, but yields the answer incrementally as the model produces it."""
+    user_actions_logger.info(f"Handling streamed query: '{question}'")
+    try:
+        if isinstance(content, pd.DataFrame):
+            if content.empty:
+                error_logger.warning("Query on empty DataFrame.")
+                yield "This document is empty. Please upload a valid file."
+                return
+            answer = answer_table_question(question, content, detect_document_type(content))
+            if answer is not None:
+                metrics.inc("answers_total", source="table")
+                yield answer
+                return
+            query_stream = query_data_stream
+        elif isinstance(content, str):
+            if not content.strip():
+                error_logger.warning("Query on empty text content.")
+                yield "This document is empty. Please upload a valid file."
+                return
+            query_stream = query_pdf_text_stream
+        else:
+            error_logger.error("Unsupported document format for query.")
+            yield "Unsupported document format."
+            return
+        answer = _cached_answer(question, content, model, scope, semantic_cache)
+        if answer is not None:
+            metrics.inc("answers_total", source="cache")
+            yield answer
+            return
+        metrics.inc("answers_total", source="llm")
+        tokens = []
+        for token in query_stream(question, content, model=model):
+            tokens.append(token)
+            yield token
+        _store_answer(question, content, model, "".join(tokens), scope, semantic_cache)
+    except Exception as e:
+        error_logger.error(f"Error processing query: {e}")
+        yield f"Sorry, there was an error processing your question: {e}"
+
+def handle_uploaded_file(uploaded_file, on_progress=None):
     upload_logger.info(f"Handling uploaded file: {uploaded_file.name}")
-    content = extract_content(uploaded_file)
+    content = extract_content(uploaded_file, on_progress=on_progress)
     if (isinstance(content, pd.DataFrame) and content.empty) or (isinstance(content, str) and not content.strip()):
         error_logger.warning(f"Uploaded file {uploaded_file.name} is empty.")
         return "empty", None
@@ -83,50 +159,161 @@ def route_query(doc_type, content, query):
     else:
         return default_llm_response(query)
 
-def extract_content(uploaded_file):
+def file_kind(filename):
+    return filename.rsplit(".", 1)[-1].lower() if "." in filename else "unknown"
+
+def parse_file_bytes(data, filename, on_progress=None):
+    filename = filename.lower()
+    if filename.endswith((".csv", ".xlsx")):
+        df = load_table(data, filename)
+        report = df.attrs["load_report"]
+        upload_logger.info(
+            f"Loaded {report['rows_loaded']} of {report['rows_total']} rows from {filename} "
+            f"({report['memory_bytes'] / (1024**2):.1f} MB in memory{', sampled' if report['sampled'] else ''})"
+        )
+        return df
+    elif filename.endswith(".pdf"):
+        # pdfplumber is only loaded once a PDF is uploaded.
+        from logic.pdf_extractor import extract_pdf_text
+        return extract_pdf_text(data, on_page=on_progress)
+    elif filename.endswith(".txt"):
+        return load_text(data)
+    return None
+
+def parse_file_cached(file, on_progress=None):
+    """Parse an uploaded file, reusing a cached result when the same bytes were parsed before."""
+    data = read_file_bytes(file)
+    key = cache_key(data, file.name)
+    content = parse_cache.get(key)
+    if content is not None:
+        upload_logger.info(f"Parse cache hit for file: {file.name}")
+        metrics.inc("parse_cache_hits_total")
+        return content
+    with metrics.span("parse", kind=file_kind(file.name)):
+        content = parse_file_bytes(data, file.name, on_progress=on_progress)
+    return parse_cache.put(key, content)
+
+def extract_content(uploaded_file, on_progress=None):
     filename = uploaded_file.name.lower()
     try:
-        if filename.endswith(".csv"):
-            return pd.read_csv(uploaded_file)
-        elif filename.endswith(".xlsx"):
-            return pd.read_excel(uploaded_file)
-        elif filename.endswith(".pdf"):
-            with pdfplumber.open(uploaded_file) as pdf:
-                all_text = ""
-                for page in pdf.pages:
-                    all_text += page.extract_text() + "\n"
-            return all_text
-        else:
-            return None
+        return parse_file_cached(uploaded_file, on_progress=on_progress)
     except Exception as e:
         error_logger.error(f"Error extracting content from {filename}: {e}")
         return None
 
 def classify_doc_type(content):
-    if isinstance(content, pd.DataFrame):
-        from .parser import detect_document_type
-        return detect_document_type(content)
-    elif isinstance(content, str):
-        lowered = content.lower()
-        if "invoice" in lowered:
-            return "invoice"
-        elif "attendance" in lowered:
-            return "attendance"
-        else:
-            return "unknown"
-    else:
-        return "unknown"
+    with metrics.span("classify"):
+        result = classify(content)
+    classification_logger.info(f"Classified as {result.doc_type} with confidence {result.confidence:.2f}")
+    return result.doc_type
 
 def answer_attendance(content, query):
+    answer = answer_table_question(query, content, "attendance")
+    if answer is not None:
+        user_actions_logger.info(f"Answered attendance query from table: '{query}'")
+        return answer
     return query_data(query, content)
 
 def answer_invoice(content, query):
+    answer = answer_table_question(query, content, "invoice")
+    if answer is not None:
+        user_actions_logger.info(f"Answered invoice query from table: '{query}'")
+        return answer
     return query_data(query, content)
 
 def default_llm_response(query):
     return f"Sorry, I couldn't find a specific answer. Here is a generic response to: {query}"
 
+def _answer_status(answer):
+    lowered = answer.lower()
+    if not answer.strip() or any(phrase in lowered for phrase in NO_ANSWER_PHRASES):
+        return "no_answer"
+    if answer.startswith("Sorry, there was an error") or "[Fallback failed]" in answer:
+        return "error"
+    return "answered"
+
+def _normalize_answer(answer):
+    # Answers differing only in case, punctuation or spacing agree.
+    return " ".join(re.sub(r"[^\w\s]", " ", answer.lower()).split())
+
 def handle_conflicting_answers(answers):
-    if len(set(answers)) > 1:
-        return "Multiple documents provide different answers:\n" + "\n---\n".join(answers)
-    return answers[0] if answers else "No answer found."
+    """Merge answers given as (source file, answer) pairs or plain strings.
+
+    Answers that agree are given once with all their sources; answers that differ are listed under their sources.
+    """
+    groups = {}  # normalized answer -> (answer, sources), in first-seen order
+    for item in answers:
+        source, answer = item if isinstance(item, tuple) else (None, item)
+        answer = answer.strip()
+        if not answer:
+            continue
+        _, sources = groups.setdefault(_normalize_answer(answer), (answer, []))
+        if source:
+            sources.append(source)
+    if not groups:
+        return "No answer found."
+    if len(groups) == 1:
+        answer, sources = next(iter(groups.values()))
+        return f"{answer}\n\n_Source: {', '.join(sources)}_" if sources else answer
+    return "Multiple documents provide different answers:\n" + "\n---\n".join(
+        f"**{', '.join(sources)}**: {answer}" if sources else answer for answer, sources in groups.values()
+    )
+
+def fan_out_query(question, documents, model=None, semantic_cache=False, timeout=FANOUT_DOCUMENT_TIMEOUT):
+    """Ask a question of each document separately and concurrently, then merge the answers with their sources.
+
+    documents are dicts with "filename", "content" and "doc_hash". Returns (merged answer, results), where results
+    holds one dict per document, in order, with its filename, answer, status ("answered", "no_answer", "timeout" or
+    "error") and seconds. Latency follows the slowest document rather than the combined size of all of them.
+    """
+    user_actions_logger.info(f"Fanning out query to {len(documents)} documents: '{question}'")
+    results = [
+        {"filename": doc["filename"], "answer": None, "status": "timeout", "seconds": None} for doc in documents
+    ]
+    if not documents:
+        return "No answer found.", results
+    started = {}  # document index -> monotonic start time, set by the worker
+
+    def answer_document(i, doc):
+        started[i] = time.monotonic()
+        answer = handle_query(question, doc["content"], model=model, scope=doc["doc_hash"], semantic_cache=semantic_cache)
+        return answer, time.monotonic() - started[i]
+
+    executor = ThreadPoolExecutor(max_workers=min(FANOUT_CONCURRENCY, len(documents)), thread_name_prefix="fanout")
+    # One context copy per document keeps the request ID in the workers' logs.
+    futures = {
+        executor.submit(contextvars.copy_context().run, answer_document, i, doc): i for i, doc in enumerate(documents)
+    }
+    pending = set(futures)
+    try:
+        with metrics.span("fanout"):
+            while pending:
+                # Queued documents have not started, so their time has not started running either.
+                deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+                wait_for = max(0, min(deadlines) - time.monotonic()) if deadlines else FANOUT_POLL_SECONDS
+                done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    answer, seconds = future.result()
+                    result = results[futures[future]]
+                    result.update(answer=answer, status=_answer_status(answer), seconds=round(seconds, 2))
+                now = time.monotonic()
+                for future in [f for f in pending if futures[f] in started and now - started[futures[f]] >= timeout]:
+                    pending.discard(future)
+                    error_logger.error(f"Fan-out answer for {results[futures[future]]['filename']} timed out after {timeout}s")
+    finally:
+        # A timed-out answer keeps its worker until the model call gives up; nobody waits for it.
+        executor.shutdown(wait=False, cancel_futures=True)
+    for result in results:
+        metrics.inc("fanout_documents_total", status=result["status"])
+    return merge_fan_out_results(results), results
+
+def merge_fan_out_results(results):
+    """Combine per-document results into one reply, noting documents without an answer."""
+    answered = [(r["filename"], r["answer"]) for r in results if r["status"] == "answered"]
+    parts = [handle_conflicting_answers(answered) if answered else "None of the documents answer this question."]
+    notes = (("no_answer", "No answer in"), ("timeout", "Timed out"), ("error", "Failed"))
+    for status, label in notes:
+        filenames = [r["filename"] for r in results if r["status"] == status]
+        if filenames and (answered or status != "no_answer"):
+            parts.append(f"_{label}: {', '.join(filenames)}_")
+    return "\n\n".join(parts)
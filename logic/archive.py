@@ -0,0 +1,99 @@
+# archive.py
+# Streams the documents inside an uploaded zip archive, one member at a time, straight from memory without extracting to disk.
+# Enforces per-archive size and member-count limits and skips duplicate members by content hash.
+
+import io
+import os
+import zipfile
+import zlib
+
+from logic.document_loader import SUPPORTED_EXTENSIONS
+from logic.logging_config import get_logger
+from logic.parse_cache import content_hash
+
+MAX_ARCHIVE_MEMBERS = 2000
+MAX_ARCHIVE_BYTES = 1024 * 1024 * 1024  # total uncompressed size
+MAX_MEMBER_BYTES = 256 * 1024 * 1024
+READ_BLOCK_BYTES = 1024 * 1024
+
+upload_logger = get_logger('upload_logger', 'upload')
+
+
+class ArchiveLimitError(ValueError):
+    pass
+
+
+def is_archive(filename):
+    return filename.lower().endswith(".zip")
+
+
+def _is_junk(name):
+    # macOS resource forks and hidden files such as .DS_Store are not documents.
+    return name.startswith("__MACOSX/") or os.path.basename(name).startswith(".")
+
+
+def _read_member(archive, info, max_bytes):
+    """Read a member in blocks, stopping as soon as it exceeds max_bytes whatever its header claims."""
+    parts = []
+    size = 0
+    with archive.open(info) as member:
+        while True:
+            block = member.read(READ_BLOCK_BYTES)
+            if not block:
+                return b"".join(parts)
+            size += len(block)
+            if size > max_bytes:
+                return None
+            parts.append(block)
+
+
+def iter_archive(data, max_members=MAX_ARCHIVE_MEMBERS, max_bytes=MAX_ARCHIVE_BYTES,
+                 max_member_bytes=MAX_MEMBER_BYTES):
+    """Yield (member name, bytes, skip reason) for each file in a zip archive, in archive order.
+
+    Exactly one of bytes and skip reason is None. Members are decompressed one at a time, so memory use is bounded
+    by the largest member rather than the archive, and reads stop at the size limits even if an archive's headers
+    understate its sizes (a zip bomb). Raises ArchiveLimitError if the archive as a whole is over a limit.
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data)
+    except zipfile.BadZipFile as e:
+        raise ArchiveLimitError(f"not a valid zip archive: {e}")
+    with archive:
+        members = [info for info in archive.infolist() if not info.is_dir() and not _is_junk(info.filename)]
+        # The central directory is checked before anything is decompressed.
+        if len(members) > max_members:
+            raise ArchiveLimitError(f"archive has {len(members)} files; the limit is {max_members}")
+        declared = sum(info.file_size for info in members)
+        if declared > max_bytes:
+            raise ArchiveLimitError(
+                f"archive expands to {declared / 1024 ** 2:.1f} MB; the limit is {max_bytes / 1024 ** 2:.1f} MB"
+            )
+        seen = {}  # content hash -> first member with that content
+        total = 0
+        for info in members:
+            name = info.filename
+            if not name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield name, None, "unsupported file type"
+                continue
+            if info.flag_bits & 0x1:
+                yield name, None, "encrypted"
+                continue
+            if info.file_size > max_member_bytes:
+                yield name, None, f"larger than {max_member_bytes / 1024 ** 2:.0f} MB"
+                continue
+            try:
+                member_data = _read_member(archive, info, min(max_member_bytes, max_bytes - total))
+            except (zipfile.BadZipFile, zlib.error, NotImplementedError) as e:
+                yield name, None, f"unreadable: {e}"
+                continue
+            if member_data is None:
+                raise ArchiveLimitError(f"{name} expands beyond the size recorded in the archive")
+            total += len(member_data)
+            digest = content_hash(member_data)
+            if digest in seen:
+                yield name, None, f"duplicate of {seen[digest]}"
+                continue
+            seen[digest] = name
+            yield name, member_data, None
+    upload_logger.info(f"Read {len(seen)} unique documents ({total / 1024 ** 2:.1f} MB) from a {len(members)}-file archive")
@@ -0,0 +1,125 @@
+# bm25.py
+# Inverted-index BM25 keyword scoring over the same chunks as the FAISS vector index, keyed by docstore id.
+# Catches exact-token lookups (invoice numbers, roll numbers, codes) that dense embeddings miss; fused with vector
+# results by reciprocal rank in retrieval.py.
+
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_FILE = "bm25.json.gz"
+# Bump when tokenize() changes; saved indexes with another version are rebuilt from the docstore.
+TOKENIZER_VERSION = 1
+
+# Identifiers such as "INV-20931", "A/12" or "v1.2" are kept whole and also split into their parts.
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_/.][a-z0-9]+)*")
+_SEPARATORS = re.compile(r"[-_/.]")
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from has have how i in is it its of on or show tell the "
+    "their there this to was were what when where which who whom why with".split()
+)
+
+
+def tokenize(text):
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        # Fold simple plurals ("markers" -> "marker"); documents and queries are folded alike.
+        if token.isalpha() and len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _SEPARATORS.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # term -> {doc_id: term frequency}
+        self._lengths = {}  # doc_id -> number of tokens
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, doc_id, text):
+        tokens = tokenize(text)
+        self._lengths[doc_id] = len(tokens)
+        self._total_length += len(tokens)
+        for term, count in Counter(tokens).items():
+            self._postings.setdefault(term, {})[doc_id] = count
+
+    @classmethod
+    def from_store(cls, store):
+        """Index every chunk of a FAISS store under its docstore id."""
+        index = cls()
+        for doc_id in store.index_to_docstore_id.values():
+            index.add(doc_id, store.docstore.search(doc_id).page_content)
+        return index
+
+    def merge_from(self, other):
+        """Add another index's documents to this one; the other index is left unchanged."""
+        for term, postings in other._postings.items():
+            self._postings.setdefault(term, {}).update(postings)
+        for doc_id, length in other._lengths.items():
+            self._total_length += length - self._lengths.get(doc_id, 0)
+            self._lengths[doc_id] = length
+
+    def search(self, query, k=10):
+        """Return up to k (doc_id, score) pairs, best first; documents sharing no term with the query are omitted."""
+        if not self._lengths:
+            return []
+        n = len(self._lengths)
+        average_length = self._total_length / n or 1
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, directory):
+        data = {
+            "version": TOKENIZER_VERSION, "k1": self.k1, "b": self.b,
+            "lengths": self._lengths, "postings": self._postings,
+        }
+        with gzip.open(os.path.join(directory, BM25_FILE), "wt", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, directory):
+        """Load an index saved with save(), or return None if the directory has none or it is out of date."""
+        path = os.path.join(directory, BM25_FILE)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != TOKENIZER_VERSION:
+            return None
+        index = cls(data["k1"], data["b"])
+        index._postings = data["postings"]
+        index._lengths = data["lengths"]
+        index._total_length = sum(index._lengths.values())
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse ranked lists of ids into one (id, score) list, best first. k damps the weight of top ranks (60 is standard)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,137 @@
+# classifier.py
+# Single document-type classifier for tables and text with keyword sets compiled once at import.
+# Inspects only a bounded sample of each document, returns confidence scores and can classify batches in one call.
+
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from typing import NamedTuple
+
+import pandas as pd
+
+ATTENDANCE_COLUMN_KEYWORDS = [
+    "student", "present", "absent", "p", "a", "attendance", "roll", "name", "employee", "reg no", "register", "roll no", "rollno", "enrollment", "attended", "total classes", "attendance %", "attendance%", "attn", "att.", "attd", "attnd", "attendence"
+]
+INVOICE_ITEM_COLUMNS = {"item", "product", "description"}
+INVOICE_PRICE_COLUMN = re.compile(r"price|cost")
+INVOICE_VALUE_WORDS = re.compile(r"rs|₹|\$|price|total")
+# Keywords counted in free text to score each label; the label itself is decided by TEXT_DECISION_KEYWORDS.
+TEXT_KEYWORDS = {
+    "invoice": ["invoice", "total", "price", "amount due", "subtotal", "bill to"],
+    "attendance": ["attendance", "present", "absent", "roll no"],
+}
+# Any mention of "invoice" makes text an invoice, otherwise any mention of "attendance" makes it attendance.
+TEXT_DECISION_KEYWORDS = ["invoice", "attendance"]
+
+# Only this much of a document is inspected.
+SAMPLE_ROWS = 1000
+INVOICE_SAMPLE_ROWS = 10
+TEXT_SAMPLE_CHARS = 20000
+
+# Separator that cannot occur in a keyword, so joined column names (or texts) can be searched in one pass.
+_COLUMN_SEPARATOR = "\x00"
+# The lookahead finds, at every position, the longest keyword starting there; the keywords contained in it are
+# found through _CONTAINED, so one scan yields the same set as testing every keyword against every column.
+_ATTENDANCE_PATTERN = re.compile(
+    "(?=(" + "|".join(re.escape(k) for k in sorted(ATTENDANCE_COLUMN_KEYWORDS, key=len, reverse=True)) + "))"
+)
+_CONTAINED = {key: frozenset(k for k in ATTENDANCE_COLUMN_KEYWORDS if k in key) for key in ATTENDANCE_COLUMN_KEYWORDS}
+_DECISION_PATTERN = re.compile("|".join(re.escape(k) for k in TEXT_DECISION_KEYWORDS))
+_TEXT_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(k) for keys in TEXT_KEYWORDS.values() for k in sorted(keys, key=len, reverse=True)) + r")\b"
+)
+_TEXT_LABELS = {keyword: label for label, keys in TEXT_KEYWORDS.items() for keyword in keys}
+
+
+class Classification(NamedTuple):
+    doc_type: str
+    confidence: float
+    scores: dict
+
+
+UNKNOWN = Classification("unknown", 0.0, {})
+
+
+@lru_cache(maxsize=1024)
+def _attendance_matches(cols):
+    """Attendance keywords found in a tuple of column names; batches of same-format files share the result."""
+    matches = set()
+    for found in set(_ATTENDANCE_PATTERN.findall(_COLUMN_SEPARATOR.join(cols))):
+        matches |= _CONTAINED[found]
+    return frozenset(matches)
+
+
+def classify_table(df):
+    df = df.head(SAMPLE_ROWS).dropna(how="all")  # remove fully empty rows
+    cols = [str(col).lower().strip() for col in df.columns]
+    col_matches = _attendance_matches(tuple(cols))
+    attendance_ratio = len(col_matches) / len(cols) if cols else 0.0
+    # At least 2 attendance keywords in columns, at least 3 columns, and at least 50% of columns are attendance keywords
+    if len(col_matches) >= 2 and len(cols) >= 3 and attendance_ratio >= 0.5 and len(df) >= 2:
+        return Classification("attendance", min(1.0, attendance_ratio), {"attendance": attendance_ratio})
+
+    has_item = any(col in INVOICE_ITEM_COLUMNS for col in cols)
+    if has_item:
+        has_price_col = any(INVOICE_PRICE_COLUMN.search(col) for col in cols)
+        has_price_values = False
+        if not has_price_col:
+            sample_text = " ".join(str(val).lower() for val in df.head(INVOICE_SAMPLE_ROWS).values.flatten())
+            has_price_values = bool(INVOICE_VALUE_WORDS.search(sample_text))
+        if has_price_col or has_price_values:
+            confidence = 0.9 if has_price_col else 0.6
+            return Classification("invoice", confidence, {"invoice": confidence, "attendance": attendance_ratio})
+
+    return Classification("unknown", 0.0, {"attendance": attendance_ratio})
+
+
+def _text_result(keywords, mentioned):
+    scores = dict.fromkeys(TEXT_KEYWORDS, 0)
+    for keyword in keywords:
+        scores[_TEXT_LABELS[keyword]] += 1
+    label = next((label for label in TEXT_DECISION_KEYWORDS if label in mentioned), None)
+    if label is None:
+        return Classification("unknown", 0.0, scores)
+    # Share of keyword hits for the decided label, discounted when there are only a few hits.
+    hits = max(scores[label], 1)
+    total = max(sum(scores.values()), hits)
+    return Classification(label, round(hits / total * min(1.0, total / 3), 3), scores)
+
+
+def classify_text(text):
+    sample = text[:TEXT_SAMPLE_CHARS].lower()
+    return _text_result(_TEXT_PATTERN.findall(sample), set(_DECISION_PATTERN.findall(sample)))
+
+
+def _classify_texts(texts):
+    """Classify many texts with one scan of each pattern over their joined samples."""
+    samples = [text[:TEXT_SAMPLE_CHARS].lower() for text in texts]
+    starts = []
+    offset = 0
+    for sample in samples:
+        starts.append(offset)
+        offset += len(sample) + 1
+    joined = _COLUMN_SEPARATOR.join(samples)
+    keywords = [[] for _ in samples]
+    mentioned = [set() for _ in samples]
+    for match in _TEXT_PATTERN.finditer(joined):
+        keywords[bisect_right(starts, match.start()) - 1].append(match.group(1))
+    for match in _DECISION_PATTERN.finditer(joined):
+        mentioned[bisect_right(starts, match.start()) - 1].add(match.group(0))
+    return [_text_result(k, m) for k, m in zip(keywords, mentioned)]
+
+
+def classify(content):
+    if isinstance(content, pd.DataFrame):
+        return classify_table(content)
+    if isinstance(content, str):
+        return classify_text(content)
+    return UNKNOWN
+
+
+def classify_batch(contents):
+    """Classify many parsed documents (DataFrames or text) in one call; texts are scanned together."""
+    results = [classify(content) if not isinstance(content, str) else None for content in contents]
+    text_positions = [i for i, content in enumerate(contents) if isinstance(content, str)]
+    for i, result in zip(text_positions, _classify_texts([contents[i] for i in text_positions])):
+        results[i] = result
+    return results
@@ -1,16 +1,174 @@
 # document_loader.py
-# Provides functions to load and parse document files (CSV, XLSX) into pandas DataFrames for further processing.
-# Used by the backend logic to standardize document input.
+# Provides functions to load and parse document files (CSV, XLSX) into pandas DataFrames, and plain text files, for further processing.
+# Used by the backend logic to standardize document input. Large tables are read in chunks with compact dtypes,
+# and files beyond the configured row/byte cap are reduced to a random sample plus a full-file summary.
 
-import pandas as pd
+import importlib.util
+import io
 import os
 
-def load_document(file):
-    filename = file.name
+import numpy as np
+import pandas as pd
+
+SUPPORTED_EXTENSIONS = (".csv", ".xlsx", ".pdf", ".txt")
+CHUNK_ROWS = 100_000
+# Tables above either cap are sampled instead of loaded in full.
+MAX_ROWS = 2_000_000
+MAX_BYTES = 512 * 1024 * 1024
+SAMPLE_ROWS = 100_000
+# Text columns with at most this share of distinct values become categoricals.
+CATEGORY_MAX_RATIO = 0.5
+# Text files are truncated to this many bytes, the same cap as text extracted from a PDF.
+MAX_TEXT_BYTES = 100 * 1024 * 1024
+
+# Arrow-backed strings need pyarrow; without it text columns keep pandas' default dtype.
+STRING_DTYPE = "string[pyarrow]" if importlib.util.find_spec("pyarrow") else None
+
+
+def optimize_dtypes(df):
+    """Downcast integer columns and store text columns as Arrow strings; floats are kept at full precision."""
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_integer_dtype(series):
+            df[col] = pd.to_numeric(series, downcast="integer")
+        elif STRING_DTYPE and (series.dtype == object or pd.api.types.is_string_dtype(series)):
+            df[col] = series.astype(STRING_DTYPE)
+    return df
+
+
+def categorize(df):
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_string_dtype(series) and len(series):
+            if series.nunique(dropna=True) <= len(series) * CATEGORY_MAX_RATIO:
+                df[col] = series.astype("category")
+    return df
+
+
+def _footprint(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def _update_summary(summary, chunk):
+    """Add a chunk's counts and numeric stats to the running per-column summary.
+
+    Values are coerced to numbers in every chunk, so a chunk where one stray cell made pandas read the column as
+    text still counts toward the totals; cells that are not numbers are counted as "non_numeric".
+    """
+    for col in chunk.columns:
+        series = chunk[col]
+        stats = summary.setdefault(str(col), {"count": 0, "nulls": 0, "non_numeric": 0})
+        present = int(series.notna().sum())
+        stats["count"] += present
+        stats["nulls"] += len(series) - present
+        if pd.api.types.is_bool_dtype(series) or not present:
+            continue
+        if pd.api.types.is_numeric_dtype(series):
+            numbers = series
+        elif "sum" not in stats and stats["non_numeric"]:
+            # A text column so far: earlier chunks had no numbers at all, so skip the conversion.
+            stats["non_numeric"] += present
+            continue
+        else:
+            numbers = pd.to_numeric(series, errors="coerce")
+        valid = int(numbers.notna().sum())
+        stats["non_numeric"] += present - valid
+        if valid:
+            stats["sum"] = stats.get("sum", 0.0) + float(numbers.sum())
+            stats["min"] = min(stats.get("min", float("inf")), float(numbers.min()))
+            stats["max"] = max(stats.get("max", float("-inf")), float(numbers.max()))
+
+
+def _finish_summary(summary):
+    for stats in summary.values():
+        if "sum" in stats:
+            # Numeric totals that skipped some cells are marked so they are not presented as whole-column figures.
+            stats["partial"] = stats["non_numeric"] > 0
+        else:
+            del stats["non_numeric"]
+    return summary
+
+
+def _iter_chunks(data, filename):
     ext = os.path.splitext(filename)[-1].lower()
     if ext == ".csv":
-        return pd.read_csv(file)
+        yield from pd.read_csv(io.BytesIO(data), chunksize=CHUNK_ROWS)
     elif ext == ".xlsx":
-        return pd.read_excel(file)
+        # openpyxl cannot stream into pandas, so the sheet is read once and then processed like CSV chunks.
+        df = pd.read_excel(io.BytesIO(data))
+        for start in range(0, len(df), CHUNK_ROWS):
+            yield df.iloc[start:start + CHUNK_ROWS].copy()
+        if df.empty:
+            yield df
+    else:
+        raise ValueError("Unsupported file format")
+
+
+def load_table(data, filename, max_rows=MAX_ROWS, max_bytes=MAX_BYTES, sample_rows=SAMPLE_ROWS, seed=0):
+    """Load a CSV/XLSX file with compact dtypes.
+
+    The returned DataFrame carries a "load_report" in df.attrs with the row counts, whether it was
+    sampled, its in-memory footprint and, for sampled tables, a summary computed over the full file.
+    """
+    rng = np.random.default_rng(seed)
+    chunks = []
+    sample = None
+    loaded_bytes = 0
+    rows_total = 0
+    summary = {}
+    for chunk in _iter_chunks(data, filename):
+        chunk = optimize_dtypes(chunk)
+        chunk.index = pd.RangeIndex(rows_total, rows_total + len(chunk))
+        rows_total += len(chunk)
+        _update_summary(summary, chunk)
+        if sample is None:
+            chunks.append(chunk)
+            loaded_bytes += _footprint(chunk)
+            if rows_total <= max_rows and loaded_bytes <= max_bytes:
+                continue
+            # Over the cap: switch to a reservoir sample of the rows seen so far and everything after.
+            chunk = pd.concat(chunks)
+            chunks = []
+        # Keep the sample_rows rows with the smallest random keys, which is a uniform sample of all rows.
+        keyed = chunk.assign(_sample_key=rng.random(len(chunk)))
+        sample = keyed if sample is None else pd.concat([sample, keyed])
+        sample = sample.nsmallest(sample_rows, "_sample_key")
+
+    if sample is not None:
+        df = sample.drop(columns="_sample_key").sort_index()
+    elif chunks:
+        df = pd.concat(chunks)
+    else:
+        df = pd.DataFrame()
+    # Chunks may have inferred different types for the same column; settle them on the combined frame.
+    df = categorize(optimize_dtypes(df.reset_index(drop=True)))
+    df.attrs["load_report"] = {
+        "rows_total": rows_total,
+        "rows_loaded": len(df),
+        "sampled": sample is not None,
+        "memory_bytes": _footprint(df),
+        "summary": _finish_summary(summary) if sample is not None else None,
+    }
+    return df
+
+
+def load_text(data, max_bytes=MAX_TEXT_BYTES):
+    """Decode a text file as UTF-8 (with or without BOM), falling back to Latin-1 for legacy encodings."""
+    data = data[:max_bytes]
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        # A cut at max_bytes can split a multi-byte character; anything else is not UTF-8.
+        if e.start >= len(data) - 3 and len(data) == max_bytes:
+            return data[:e.start].decode("utf-8-sig")
+        return data.decode("latin-1")
+
+
+def load_document(file):
+    filename = file.name
+    ext = os.path.splitext(filename)[-1].lower()
+    if ext in (".csv", ".xlsx"):
+        data = file.getvalue() if hasattr(file, "getvalue") else file.read()
+        return load_table(data, filename)
     else:
-        raise ValueError("Unsupported file format")
\ No newline at end of file
+        raise ValueError("Unsupported file format")
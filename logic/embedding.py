@@ -0,0 +1,131 @@
+# embedding.py
+# Batched, multi-core sentence-transformer embeddings and compact FAISS index construction.
+# Used by the index store and vectorstore helpers so embedding throughput and index memory can be tuned.
+
+import atexit
+import os
+import threading
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 64
+# Number of worker processes used to shard large embedding jobs; 1 embeds in-process.
+# Each worker loads its own copy of the model, so the default stops at 4.
+EMBEDDING_WORKERS = int(os.environ.get("EMBEDDING_WORKERS", max(1, min(4, (os.cpu_count() or 1) // 2))))
+# Torch threads per process; None keeps the torch default.
+EMBEDDING_THREADS = None
+# "float32", "float16" or "int8". Reduced precision halves (or quarters) index memory.
+VECTOR_DTYPE = "float16"
+# int8 codebooks are trained on at most this many of an index's vectors.
+QUANTIZER_TRAINING_SAMPLE = 65536
+
+_QUANTIZER_TYPES = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+class BatchedEmbeddings(Embeddings):
+    """LangChain embeddings backed by SentenceTransformer with explicit batching and a worker pool."""
+
+    def __init__(self, model_name=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE,
+                 workers=EMBEDDING_WORKERS, threads=EMBEDDING_THREADS):
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.batch_size = batch_size
+        self.workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+                atexit.register(self.close)
+            return self._pool
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+    def encode(self, texts):
+        """Return normalized float32 embeddings as a (len(texts), dim) array."""
+        # Only shard when every worker gets at least one full batch; otherwise IPC dominates.
+        if self.workers > 1 and len(texts) >= self.batch_size * self.workers:
+            vectors = self.model.encode_multi_process(
+                texts, self._get_pool(), batch_size=self.batch_size, normalize_embeddings=True
+            )
+        else:
+            vectors = self.model.encode(
+                texts, batch_size=self.batch_size, convert_to_numpy=True, normalize_embeddings=True
+            )
+        return np.asarray(vectors, dtype="float32")
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.encode([text])[0].tolist()
+
+
+def new_faiss_index(vectors, dtype=VECTOR_DTYPE):
+    """Return an empty index for vectors like these, with any int8 codebook trained on (a sample of) them."""
+    dim = vectors.shape[1]
+    if dtype == "float32":
+        return faiss.IndexFlatL2(dim)
+    index = faiss.IndexScalarQuantizer(dim, _QUANTIZER_TYPES[dtype], faiss.METRIC_L2)
+    if not index.is_trained:
+        # Normalized MiniLM components mostly lie within about +-0.1, so the 256 int8 levels are spread over each
+        # dimension's observed range rather than [-1, 1]. The small margin keeps single-vector ranges non-empty.
+        if len(vectors) > QUANTIZER_TRAINING_SAMPLE:
+            vectors = vectors[np.random.default_rng(0).choice(len(vectors), QUANTIZER_TRAINING_SAMPLE, replace=False)]
+        low, high = vectors.min(axis=0), vectors.max(axis=0)
+        margin = np.maximum((high - low) * 0.05, 1e-4)
+        index.train(np.vstack([vectors, low - margin, high + margin]).astype("float32"))
+    return index
+
+
+def _codebook(index):
+    return faiss.vector_to_array(index.sq.trained) if isinstance(index, faiss.IndexScalarQuantizer) else None
+
+
+def merge_faiss_stores(store, other):
+    """Merge other into store, like FAISS.merge_from (which leaves other empty).
+
+    int8 indexes are trained per document, so a session index keeps the codebook of its first document and each
+    merged document is re-encoded with it; vectors already in store are never re-quantized. Components outside the
+    session codebook's range are clipped to it.
+    """
+    mine, theirs = _codebook(store.index), _codebook(other.index)
+    if mine is not None and theirs is not None and not np.array_equal(mine, theirs):
+        vectors = other.index.reconstruct_n(0, other.index.ntotal)
+        other.index = faiss.clone_index(store.index)
+        other.index.reset()
+        other.index.add(vectors)
+    store.merge_from(other)
+
+
+def build_faiss_store(chunks, embeddings, dtype=VECTOR_DTYPE):
+    """Embed chunk Documents in batches and store them in a (possibly quantized) FAISS index."""
+    texts = [chunk.page_content for chunk in chunks]
+    if isinstance(embeddings, BatchedEmbeddings):
+        vectors = embeddings.encode(texts)
+    else:
+        vectors = np.asarray(embeddings.embed_documents(texts), dtype="float32")
+    store = FAISS(embeddings, new_faiss_index(vectors, dtype), InMemoryDocstore(), {})
+    store.add_embeddings(zip(texts, vectors), metadatas=[chunk.metadata for chunk in chunks])
+    return store
+
+
+def index_nbytes(index):
+    return int(faiss.serialize_index(index).nbytes)
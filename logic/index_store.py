@@ -0,0 +1,132 @@
+# index_store.py
+# Persistent FAISS indexes keyed by document content hash, each saved with a BM25 keyword index over the same chunks,
+# plus a process-wide embedding model. Lets sessions reuse embeddings for documents seen before and only embed chunks of new documents.
+
+import os
+import shutil
+import tempfile
+import threading
+
+import faiss
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from logic.bm25 import BM25Index
+from logic.embedding import BatchedEmbeddings, build_faiss_store, VECTOR_DTYPE
+from logic.logging_config import get_logger
+
+# Bump when chunking or the embedding model changes so stale indexes are rebuilt.
+INDEX_VERSION = "4"
+INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'indexes')
+
+upload_logger = get_logger('upload_logger', 'upload')
+error_logger = get_logger('error_logger', 'errors')
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings():
+    """Return the embedding model, loading it once per process."""
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            _embeddings = BatchedEmbeddings()
+        return _embeddings
+
+
+def clone_store(store):
+    """Return an independent copy of a FAISS store.
+
+    FAISS merge_from empties the index it merges from, so shared indexes must be cloned before merging.
+    """
+    docstore = InMemoryDocstore(dict(store.docstore._dict))
+    return FAISS(store.embedding_function, faiss.clone_index(store.index), docstore, dict(store.index_to_docstore_id))
+
+
+class IndexStore:
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        self._stores = {}  # doc_hash -> FAISS, shared by every session in this process
+        self._keywords = {}  # doc_hash -> BM25Index over the same chunks
+        self._build_locks = {}  # doc_hash -> lock held while that document is loaded or built
+        self._lock = threading.Lock()
+
+    def _path(self, doc_hash):
+        return os.path.join(self.index_dir, f"{doc_hash}-v{INDEX_VERSION}-{VECTOR_DTYPE}")
+
+    def contains(self, doc_hash):
+        return doc_hash in self._stores or os.path.isdir(self._path(doc_hash))
+
+    def get_or_build(self, doc_hash, build_chunks):
+        """Return the FAISS index for a document, loading it from disk or embedding build_chunks() on a miss.
+
+        The document's BM25 index is loaded or built at the same time; see keyword_index().
+        """
+        with self._lock:
+            store = self._stores.get(doc_hash)
+            build_lock = self._build_locks.setdefault(doc_hash, threading.Lock())
+        if store is not None:
+            return store
+        # Sessions adding the same document at once wait for one load or build instead of embedding it twice.
+        with build_lock:
+            with self._lock:
+                store = self._stores.get(doc_hash)
+            if store is not None:
+                return store
+            return self._load_or_build(doc_hash, build_chunks)
+
+    def _load_or_build(self, doc_hash, build_chunks):
+        path = self._path(doc_hash)
+        store = None
+        keywords = None
+        if os.path.isdir(path):
+            try:
+                store = FAISS.load_local(path, get_embeddings(), allow_dangerous_deserialization=True)
+                keywords = BM25Index.load(path)
+                if keywords is None:
+                    # Saved before keyword search was added or with an older tokenizer: rebuilding needs no re-embedding.
+                    keywords = BM25Index.from_store(store)
+                    try:
+                        keywords.save(path)
+                    except OSError as e:
+                        error_logger.error(f"Error saving keyword index for {doc_hash}: {e}")
+                upload_logger.info(f"Loaded vector index from disk: {doc_hash}")
+            except Exception as e:
+                error_logger.error(f"Error loading vector index {doc_hash}, rebuilding: {e}")
+                store = None
+        if store is None:
+            chunks = build_chunks()
+            if not chunks:
+                return None
+            store = build_faiss_store(chunks, get_embeddings())
+            keywords = BM25Index.from_store(store)
+            self._save(store, keywords, path)
+            upload_logger.info(f"Built vector index with {len(chunks)} chunks: {doc_hash}")
+        with self._lock:
+            self._stores[doc_hash] = store
+            self._keywords[doc_hash] = keywords
+        return store
+
+    def keyword_index(self, doc_hash):
+        """Return the BM25 index of a document already returned by get_or_build(), or None."""
+        with self._lock:
+            return self._keywords.get(doc_hash)
+
+    def _save(self, store, keywords, path):
+        tmp_path = None
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            # A unique directory, so processes saving the same document never write into each other's files.
+            tmp_path = tempfile.mkdtemp(dir=self.index_dir, prefix=os.path.basename(path) + ".tmp-")
+            store.save_local(tmp_path)
+            keywords.save(tmp_path)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            error_logger.error(f"Error saving vector index to {path}: {e}")
+            if tmp_path is not None:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+index_store = IndexStore()
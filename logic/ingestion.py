@@ -0,0 +1,310 @@
+# ingestion.py
+# Background ingestion queue: uploaded files are parsed and classified in a process pool, then indexed on a worker thread.
+# Each file gets a job id whose status and progress can be polled, so the UI stays usable while large uploads are processed.
+
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+
+from logic.agent_controller import parse_file_bytes, classify_doc_type, file_kind
+from logic.archive import iter_archive
+from logic.logging_config import get_logger, init_worker_logging, worker_log_queue
+from logic.metrics import metrics
+from logic.parse_cache import parse_cache, cache_key, content_hash
+from logic.retrieval import chunk_content
+from logic.table_store import table_store
+
+INGEST_WORKERS = min(4, os.cpu_count() or 1)
+# Archive members read but not yet parsed; bounds the memory used while a large archive is being queued.
+ARCHIVE_IN_FLIGHT = INGEST_WORKERS * 2
+# Job states, in the order a successful job passes through them.
+QUEUED, PARSING, CLASSIFYING, INDEXING, DONE, FAILED = "queued", "parsing", "classifying", "indexing", "done", "failed"
+FINISHED = (DONE, FAILED)
+# Finished jobs stay pollable this long, and at most this many are kept; older ones are dropped with any content
+# their session never collected. The cap is above MAX_ARCHIVE_MEMBERS so one archive's jobs are never cut short.
+FINISHED_JOB_TTL = 60 * 60
+MAX_FINISHED_JOBS = 5000
+
+upload_logger = get_logger('upload_logger', 'upload')
+error_logger = get_logger('error_logger', 'errors')
+
+_progress_queue = None
+
+
+def _init_worker(progress_queue, log_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+    init_worker_logging(log_queue)
+
+
+def _report(job_id, status, progress):
+    _progress_queue.put((job_id, status, progress))
+
+
+def _parse_job(job_id, data, filename):
+    """Runs in a worker process: parse and classify one file.
+
+    Tables are handed back by parse cache key; the parent opens the memory-mapped copy instead of unpickling a DataFrame.
+    Stage timings are returned too, since metrics recorded in a worker process would never reach the parent.
+    """
+    _report(job_id, PARSING, 0.0)
+    timings = {}
+    key = cache_key(data, filename)
+    content = parse_cache.get(key)
+    if content is None:
+        start = time.perf_counter()
+        content = parse_file_bytes(data, filename, on_progress=lambda done, total: _report(job_id, PARSING, done / total))
+        if content is None:
+            raise ValueError(f"Unsupported file type: {filename}")
+        content = parse_cache.put(key, content)
+        timings["parse"] = time.perf_counter() - start
+    _report(job_id, CLASSIFYING, 1.0)
+    if (isinstance(content, pd.DataFrame) and content.empty) or (isinstance(content, str) and not content.strip()):
+        return "empty", None, None, timings
+    start = time.perf_counter()
+    doc_type = classify_doc_type(content)
+    timings["classify"] = time.perf_counter() - start
+    if isinstance(content, pd.DataFrame) and table_store.contains(key):
+        return doc_type, None, key, timings
+    return doc_type, content, None, timings
+
+
+class IngestionQueue:
+    def __init__(self, workers=INGEST_WORKERS):
+        self.workers = workers
+        self._jobs = {}  # job_id -> status dict
+        self._lock = threading.Lock()
+        self._executor = None
+        self._progress = None
+        # Embedding already uses every core, so documents are indexed one at a time.
+        self._indexer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-index")
+
+    def _start(self):
+        # Called with the lock held; the pool is created on first use and recreated if a worker died.
+        if self._executor is None:
+            if self._progress is None:
+                self._progress = multiprocessing.Queue()
+                threading.Thread(target=self._drain_progress, daemon=True).start()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self._progress, worker_log_queue())
+            )
+        return self._executor
+
+    def _new_job(self, filename, doc_hash, **fields):
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "filename": filename,
+            "doc_hash": doc_hash,
+            "status": QUEUED,
+            "progress": 0.0,
+            "doc_type": None,
+            "content": None,
+            "error": None,
+            "submitted_at": time.time(),
+            "finished_at": None,
+            **fields,
+        }
+        with self._lock:
+            self._evict_finished()
+            self._jobs[job_id] = job
+        return job_id
+
+    def _evict_finished(self):
+        # Called with the lock held whenever a job is added, so the table stays bounded while uploads continue.
+        now = time.time()
+        finished = sorted((job for job in self._jobs.values() if job["status"] in FINISHED and job["finished_at"]),
+                          key=lambda job: job["finished_at"])
+        excess = len(finished) - MAX_FINISHED_JOBS
+        for i, job in enumerate(finished):
+            if i < excess or now - job["finished_at"] > FINISHED_JOB_TTL:
+                del self._jobs[job["job_id"]]
+
+    def submit(self, data, filename, index=True):
+        """Queue a file for ingestion and return its job id."""
+        job_id = self._new_job(filename, content_hash(data))
+        self._dispatch(job_id, data, filename, index)
+        return job_id
+
+    def _dispatch(self, job_id, data, filename, index, on_parsed=None):
+        with self._lock:
+            executor = self._start()
+        upload_logger.info(f"Queued ingestion job {job_id} for file: {filename}")
+        try:
+            future = executor.submit(_parse_job, job_id, data, filename)
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+                executor = self._start()
+            future = executor.submit(_parse_job, job_id, data, filename)
+        future.add_done_callback(lambda f: self._parsed(job_id, f, index))
+        if on_parsed is not None:
+            future.add_done_callback(lambda f: on_parsed())
+
+    def submit_archive(self, data, filename, index=True):
+        """Queue every document in a zip archive and return the archive's job id.
+
+        Members are read and dispatched to the worker pool from a background thread, with at most
+        ARCHIVE_IN_FLIGHT members waiting to be parsed at once. The archive job's "members" list grows as they are
+        queued. Duplicate members are skipped by iter_archive; jobs are never shared with other uploads, which may
+        belong to other sessions.
+        """
+        job_id = self._new_job(filename, content_hash(data), kind="archive", members=[], skipped=[])
+        threading.Thread(target=self._expand_archive, args=(job_id, data, filename, index),
+                         name="ingest-archive", daemon=True).start()
+        return job_id
+
+    def _expand_archive(self, job_id, data, filename, index):
+        slots = threading.BoundedSemaphore(ARCHIVE_IN_FLIGHT)
+        self._update(job_id, status=PARSING)
+        try:
+            for member, member_data, reason in iter_archive(data):
+                if reason is not None:
+                    with self._lock:
+                        self._jobs[job_id]["skipped"].append((member, reason))
+                    continue
+                member_name = f"{filename}/{member}"
+                slots.acquire()
+                member_id = self._new_job(member_name, content_hash(member_data))
+                with self._lock:
+                    self._jobs[job_id]["members"].append(member_id)
+                try:
+                    self._dispatch(member_id, member_data, member_name, index, on_parsed=slots.release)
+                except Exception as e:
+                    # The slot is only released by a parsed job, and this one never reached the pool.
+                    slots.release()
+                    self._fail(member_id, e)
+                    raise
+        except Exception as e:
+            self._fail(job_id, e)
+            return
+        job = self.status(job_id)
+        upload_logger.info(
+            f"Expanded archive {filename}: {len(job['members'])} documents queued, {len(job['skipped'])} skipped"
+        )
+        self._update(job_id, status=DONE, progress=1.0, finished_at=time.time())
+
+    def expand(self, job_ids):
+        """Job ids with each archive job followed by the jobs of its members."""
+        expanded = []
+        for job_id in job_ids:
+            expanded.append(job_id)
+            job = self.status(job_id)
+            if job is not None and job.get("kind") == "archive":
+                expanded.extend(member for member in job["members"] if member not in expanded)
+        return expanded
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _fail(self, job_id, error):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            filename = job["filename"] if job else job_id
+        error_logger.error(f"Ingestion failed for {filename}: {error}")
+        metrics.inc("uploads_total", outcome="failed")
+        self._update(job_id, status=FAILED, error=str(error), finished_at=time.time())
+
+    def _drain_progress(self):
+        while True:
+            try:
+                job_id, status, progress = self._progress.get()
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                # Progress messages can arrive after the parent has moved the job on.
+                if job is not None and job["status"] in (QUEUED, PARSING, CLASSIFYING):
+                    job["status"], job["progress"] = status, progress
+
+    def _parsed(self, job_id, future, index):
+        try:
+            doc_type, content, table_key, timings = future.result()
+            if table_key is not None:
+                content = parse_cache.get(table_key)
+                if content is None:
+                    raise ValueError("parsed table is missing from the table store")
+        except BrokenProcessPool as e:
+            self._fail(job_id, f"worker process crashed: {e}")
+            return
+        except Exception as e:
+            self._fail(job_id, e)
+            return
+        kind = file_kind(self.status(job_id)["filename"])
+        for stage, seconds in timings.items():
+            metrics.observe("stage_seconds", seconds, stage=stage, **({"kind": kind} if stage == "parse" else {}))
+        self._update(job_id, doc_type=doc_type, content=content, progress=1.0)
+        if index and content is not None:
+            self._update(job_id, status=INDEXING, progress=0.0)
+            self._indexer.submit(self._index, job_id)
+        else:
+            self._finish(job_id)
+
+    def _index(self, job_id):
+        from logic.index_store import index_store
+
+        job = self.status(job_id)
+        try:
+            with metrics.span("index"):
+                index_store.get_or_build(job["doc_hash"], lambda: chunk_content(job["filename"], job["content"], job["doc_hash"]))
+        except Exception as e:
+            # The document can still be answered from its full content without retrieval.
+            error_logger.error(f"Could not index {job['filename']} for retrieval: {e}")
+            self._update(job_id, error=f"indexing failed: {e}")
+        self._finish(job_id)
+
+    def _finish(self, job_id):
+        self._update(job_id, status=DONE, progress=1.0, finished_at=time.time())
+        job = self.status(job_id)
+        metrics.inc("uploads_total", outcome="done")
+        metrics.observe("stage_seconds", job["finished_at"] - job["submitted_at"], stage="upload")
+        upload_logger.info(
+            f"Ingested {job['filename']} as {job['doc_type']} in {job['finished_at'] - job['submitted_at']:.2f}s"
+        )
+
+    def status(self, job_id):
+        """Return a snapshot of a job's status, or None for an unknown id."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            # Archive jobs' lists keep growing while the archive is read, so callers get copies.
+            return {key: list(value) if isinstance(value, list) else value for key, value in job.items()}
+
+    def statuses(self, job_ids):
+        return [job for job in (self.status(job_id) for job_id in job_ids) if job is not None]
+
+    def wait(self, job_ids, timeout=None, poll_interval=0.1):
+        """Block until every job has finished or timeout seconds have passed; return their statuses."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            jobs = self.statuses(job_ids)
+            if all(job["status"] in FINISHED for job in jobs):
+                return jobs
+            if deadline is not None and time.monotonic() >= deadline:
+                return jobs
+            time.sleep(poll_interval)
+
+    def release(self, job_id):
+        """Drop a finished job's parsed content once the caller holds its own reference; its status stays pollable."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] in FINISHED:
+                job["content"] = None
+
+    def forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+
+ingestion_queue = IngestionQueue()
@@ -1,16 +1,14 @@
 # langchain_pipeline.py
 # Integrates LangChain and HuggingFace models for document loading, type detection, vectorstore creation, and QA chain building.
 # Supports advanced AI/ML features for DocQuery Agent.
+# LangChain, transformers and FAISS are imported inside the functions that use them, so importing this module is cheap.
 
 import os
-from langchain_community.document_loaders import PyMuPDFLoader, CSVLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings, HuggingFacePipeline
-from langchain_core.prompts import PromptTemplate
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from logic.model_registry import model_registry
 
 def load_document(file):
+    from langchain_community.document_loaders import PyMuPDFLoader, CSVLoader
+
     filename = file.name.lower()
     
     if filename.endswith('.csv'):
@@ -30,6 +28,7 @@ def load_document(file):
     return docs, "success"
 
 def detect_document_type(docs):
+    # Unlike classifier.classify_text, any "present"/"absent" means attendance and any "total"/"price" means invoice.
     content = " ".join([doc.page_content.lower() for doc in docs])
     if "present" in content or "absent" in content:
         return "attendance"
@@ -37,26 +36,34 @@ def detect_document_type(docs):
         return "invoice"
     return "unknown"
 
-def create_vectorstore(docs):
+def split_documents(docs):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = splitter.split_documents(docs)
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vectorstore = FAISS.from_documents(chunks, embeddings)
+    return splitter.split_documents(docs)
+
+def create_vectorstore(docs, split=True):
+    """Embed docs into a FAISS store. Pass split=False when docs are already chunked."""
+    from logic.embedding import build_faiss_store
+    from logic.index_store import get_embeddings
+
+    chunks = split_documents(docs) if split else docs
+    vectorstore = build_faiss_store(chunks, get_embeddings())
     return vectorstore
 
-def get_llm_pipeline():
-    model_id = "tiiuae/falcon-7b-instruct"  # Or use your local downloaded one
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
-    model = AutoModelForCausalLM.from_pretrained(model_id)
-    pipe = pipeline("text-generation", model=model, tokenizer=tokenizer, max_new_tokens=256)
-    return HuggingFacePipeline(pipeline=pipe)
+def get_llm_pipeline(model_id=None, precision=None):
+    """Return the shared local model pipeline (default: DEFAULT_LOCAL_MODEL), loading it once per process."""
+    return model_registry.get(model_id, precision)
 
-def build_qa_chain(vectorstore):
+def build_qa_chain(vectorstore, model_id=None, precision=None):
     """Return a simple QA callable using retriever + HuggingFacePipeline.
 
     LangChain v1 favors Runnable composition; we manually format prompt and invoke the LLM.
+    The chain does not hold the model: every chain shares the registry's copy, which may be evicted between questions.
     """
-    llm = get_llm_pipeline()
+    from langchain_core.prompts import PromptTemplate
+
+    get_llm_pipeline(model_id, precision)  # load now so a missing model fails here, not on the first question
     prompt_template = PromptTemplate(
         input_variables=["context", "question"],
         template=(
@@ -74,7 +81,8 @@ def build_qa_chain(vectorstore):
         formatted_prompt = prompt_template.format(context=merged_context, question=question)
         # HuggingFacePipeline supports __call__ returning text
         try:
-            result = llm(formatted_prompt)
+            with model_registry.use(model_id, precision) as llm:
+                result = llm(formatted_prompt)
             # Some pipelines may return dict; normalize
             if isinstance(result, dict):
                 return result.get("generated_text", str(result))
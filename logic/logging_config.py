@@ -1,10 +1,20 @@
 # logging_config.py
 # Configures logging for DocQuery Agent, including file-based logs and optional email alerts for errors.
-# Used by backend modules to log uploads, classifications, user actions, and errors.
+# Used by backend modules to log uploads, classifications, user actions, and errors. Records are queued and written
+# by a background listener as JSON lines to size-rotated files, tagged with the current request and session IDs.
+# Worker processes never open the log files: their records are sent back to the parent's listener.
 
+import atexit
+import contextvars
+import json
 import logging
+import multiprocessing
 import os
-from logging.handlers import SMTPHandler
+import queue
+import threading
+from contextlib import contextmanager
+from multiprocessing import util as multiprocessing_util
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, SMTPHandler, TimedRotatingFileHandler
 
 LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -14,8 +24,14 @@ LOG_FILES = {
     'classification': os.path.join(LOG_DIR, 'classification.log'),
     'errors': os.path.join(LOG_DIR, 'errors.log'),
     'user_actions': os.path.join(LOG_DIR, 'user_actions.log'),
+    'llm': os.path.join(LOG_DIR, 'llm.log'),
 }
 
+# Files rotate at LOG_MAX_BYTES, or at LOG_ROTATE_WHEN (e.g. 'midnight') if that is set; LOG_BACKUP_COUNT old files are kept.
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_WHEN = None
+LOG_BACKUP_COUNT = 5
+
 # Email alert configuration (update with your real credentials)
 MAIL_HOST = 'smtp.example.com'
 MAIL_PORT = 587
@@ -26,33 +42,214 @@ MAIL_TO = ['recipient@example.com']
 # Set to False to disable email alerts (prevents SMTP connection errors)
 ENABLE_EMAIL_ALERTS = False
 
+request_id_var = contextvars.ContextVar('request_id', default=None)
+session_id_var = contextvars.ContextVar('session_id', default=None)
+
+_queue = queue.SimpleQueue()
+_listener = None
+_listener_lock = threading.Lock()
+_queue_handlers = []  # every QueueHandler made by get_logger, pointed at another queue in worker processes
+_worker_queue = None  # multiprocessing.Queue carrying worker processes' records to the parent's listener
+_forwarder = None
+_in_worker = False  # True in worker processes, whose records go to the parent through _worker_queue
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'session_id': getattr(record, 'session_id', None),
+        }
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _ContextFilter(logging.Filter):
+    """Runs in the caller's thread: stamps the record with its log file and the caller's request/session IDs."""
+
+    def __init__(self, log_type):
+        super().__init__()
+        self.log_type = log_type
+
+    def filter(self, record):
+        record.log_type = self.log_type
+        record.request_id = request_id_var.get()
+        record.session_id = session_id_var.get()
+        return True
+
+
+class _LogTypeFilter(logging.Filter):
+    def __init__(self, log_type):
+        super().__init__()
+        self.log_type = log_type
+
+    def filter(self, record):
+        return getattr(record, 'log_type', None) == self.log_type
+
+
+def _file_handler(path, rotate=True):
+    if not rotate:
+        # Only one process may rotate a file; other writers append without rotating.
+        return logging.FileHandler(path, delay=True, encoding='utf-8')
+    if LOG_ROTATE_WHEN:
+        return TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, delay=True, encoding='utf-8')
+    return RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True, encoding='utf-8')
+
+
+def _start_listener(rotate=True):
+    """Start the single background thread that writes every queued record to its file (and sends email alerts)."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        # A process started by multiprocessing (not forked) may log before init_worker_logging() redirects it.
+        rotate = rotate and multiprocessing.parent_process() is None
+        formatter = JsonFormatter()
+        handlers = []
+        for log_type, path in LOG_FILES.items():
+            handler = _file_handler(path, rotate)
+            handler.setFormatter(formatter)
+            handler.addFilter(_LogTypeFilter(log_type))
+            handlers.append(handler)
+        # Add SMTPHandler for error logger only if enabled; it sends from the listener thread, never the request path.
+        if ENABLE_EMAIL_ALERTS:
+            try:
+                mail_handler = SMTPHandler(
+                    mailhost=(MAIL_HOST, MAIL_PORT),
+                    fromaddr=MAIL_FROM,
+                    toaddrs=MAIL_TO,
+                    subject='[DocQuery Agent] System Error Alert',
+                    credentials=(MAIL_USERNAME, MAIL_PASSWORD),
+                    secure=()
+                )
+                mail_handler.setLevel(logging.ERROR)
+                mail_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+                mail_handler.addFilter(_LogTypeFilter('errors'))
+                handlers.append(mail_handler)
+            except Exception:
+                # Silently skip if SMTP configuration fails
+                pass
+        _listener = QueueListener(_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        # Drain the queue on exit so the last records are not lost. Worker processes skip atexit
+        # but run multiprocessing finalizers.
+        atexit.register(_stop_listener)
+        multiprocessing_util.Finalize(_listener, _stop_listener, exitpriority=0)
+
+
+def _stop_listener():
+    with _listener_lock:
+        for listener in (_forwarder, _listener):
+            # The forwarder stops first so worker records it still holds reach the file listener.
+            if listener is not None and listener._thread is not None:
+                listener.stop()
+
+
+class _ForwardHandler(logging.Handler):
+    def emit(self, record):
+        _queue.put(record)
+
+
+def worker_log_queue():
+    """Return the queue to pass to worker processes' init_worker_logging(); records sent through it are written here."""
+    global _worker_queue, _forwarder
+    with _listener_lock:
+        if _worker_queue is None:
+            _worker_queue = multiprocessing.Queue()
+            _forwarder = QueueListener(_worker_queue, _ForwardHandler())
+            _forwarder.start()
+        return _worker_queue
+
+
+def _redirect(target):
+    for handler in _queue_handlers:
+        handler.queue = target
+
+
+def init_worker_logging(log_queue):
+    """Process-pool initializer: send this process's records to the parent's listener instead of the log files."""
+    global _worker_queue, _listener, _in_worker
+    with _listener_lock:
+        listener, _listener = _listener, None
+        _worker_queue = log_queue
+        _in_worker = True
+        _redirect(log_queue)
+    if listener is not None and listener._thread is not None:
+        listener.stop()
+
+
+def _after_fork_in_child():
+    # The child inherits the queue, including records the parent has not written yet, but not the listener thread.
+    # Its records go to the parent through the worker queue if there is one; otherwise it writes them itself,
+    # to a fresh queue and without rotating files the parent also writes.
+    global _listener, _listener_lock, _queue, _forwarder, _in_worker
+    _listener_lock = threading.Lock()
+    had_listener = _listener is not None
+    _listener = None
+    _forwarder = None
+    _queue = queue.SimpleQueue()
+    if _worker_queue is not None:
+        _in_worker = True
+        _redirect(_worker_queue)
+    else:
+        _redirect(_queue)
+        if had_listener:
+            _start_listener(rotate=False)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
 
 def get_logger(name, log_type):
+    if log_type not in LOG_FILES:
+        raise KeyError(f"Unknown log type: {log_type}")
     logger = logging.getLogger(name)
     if not logger.handlers:
-        handler = logging.FileHandler(LOG_FILES[log_type])
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
+        if not _in_worker:
+            _start_listener()
+        handler = QueueHandler(_worker_queue if _in_worker else _queue)
+        handler.addFilter(_ContextFilter(log_type))
+        _queue_handlers.append(handler)
         logger.addHandler(handler)
+        logger.propagate = False
         if log_type == 'errors':
             logger.setLevel(logging.ERROR)
-            # Add SMTPHandler for error logger only if enabled
-            if ENABLE_EMAIL_ALERTS:
-                try:
-                    mail_handler = SMTPHandler(
-                        mailhost=(MAIL_HOST, MAIL_PORT),
-                        fromaddr=MAIL_FROM,
-                        toaddrs=MAIL_TO,
-                        subject='[DocQuery Agent] System Error Alert',
-                        credentials=(MAIL_USERNAME, MAIL_PASSWORD),
-                        secure=()
-                    )
-                    mail_handler.setLevel(logging.ERROR)
-                    mail_handler.setFormatter(formatter)
-                    logger.addHandler(mail_handler)
-                except Exception:
-                    # Silently skip if SMTP configuration fails
-                    pass
         else:
             logger.setLevel(logging.INFO)
     return logger
+
+
+@contextmanager
+def log_context(request_id=None, session_id=None):
+    """Tag every record logged inside the block (in this thread) with the given request and/or session ID."""
+    tokens = []
+    if request_id is not None:
+        tokens.append((request_id_var, request_id_var.set(request_id)))
+    if session_id is not None:
+        tokens.append((session_id_var, session_id_var.set(session_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def tail_log(log_type, lines=20, block_size=8192):
+    """Return the last `lines` lines of a log file, reading backwards from the end instead of loading the whole file."""
+    path = LOG_FILES[log_type]
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        # One extra newline is needed to be sure the first kept line is complete.
+        while position > 0 and data.count(b'\n') <= lines:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    return [line.decode('utf-8', errors='replace') for line in data.splitlines()[-lines:]]
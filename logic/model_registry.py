@@ -0,0 +1,257 @@
+# model_registry.py
+# Process-wide registry of local HuggingFace text-generation models used by the LangChain QA chain.
+# Each model is loaded once (optionally in bfloat16 or int8) and shared by every session; idle models are evicted
+# to stay within a memory budget, and each model's load time and footprint are reported.
+
+import gc
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from logic.logging_config import get_logger
+from logic.metrics import metrics
+
+DEFAULT_LOCAL_MODEL = os.environ.get("LOCAL_LLM_MODEL", "tiiuae/falcon-7b-instruct")
+# "float32" (the default, as before), "bfloat16" (half the memory of float32) or "int8" (dynamic quantization of
+# Linear layers, CPU only). int8 models are loaded in float32 and then quantized, so only the memory they hold once
+# loaded drops; the load itself peaks at the float32 size.
+LOCAL_MODEL_PRECISION = os.environ.get("LOCAL_LLM_PRECISION", "float32")
+PRECISIONS = ("float32", "bfloat16", "int8")
+# Least recently used models are evicted to keep the loaded models' total size under this.
+MODEL_MEMORY_BUDGET = int(os.environ.get("LOCAL_LLM_MEMORY_BUDGET_MB", "16384")) * 1024 ** 2
+# Models unused for this long are released even when the registry is under budget.
+MODEL_IDLE_SECONDS = 30 * 60
+IDLE_CHECK_INTERVAL = 60
+# Set LOCAL_LLM_PREWARM=1 to load DEFAULT_LOCAL_MODEL in the background when the app starts.
+PREWARM_LOCAL_MODEL = os.environ.get("LOCAL_LLM_PREWARM") == "1"
+MAX_NEW_TOKENS = 256
+
+llm_logger = get_logger('llm_logger', 'llm')
+error_logger = get_logger('error_logger', 'errors')
+
+
+def _rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+def _model_bytes(model):
+    """Bytes held by a model's weights and buffers, counting tied and int8-packed tensors once."""
+    import torch
+
+    seen = set()
+    total = 0
+    for value in model.state_dict().values():
+        # Dynamically quantized Linear layers store their packed (weight, bias) as a tuple.
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if torch.is_tensor(tensor) and tensor.data_ptr() not in seen:
+                seen.add(tensor.data_ptr())
+                total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def load_pipeline(model_id, precision):
+    """Load a model as a LangChain HuggingFacePipeline; return (pipeline, weight bytes, peak weight bytes while loading)."""
+    import torch
+    from langchain_huggingface import HuggingFacePipeline
+    from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id,
+        torch_dtype=torch.bfloat16 if precision == "bfloat16" else torch.float32,
+        low_cpu_mem_usage=True,
+    )
+    peak = _model_bytes(model)
+    if precision == "int8":
+        # int8 weights are a quarter of float32 and use the CPU's integer matmul kernels.
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    pipe = pipeline("text-generation", model=model, tokenizer=tokenizer, max_new_tokens=MAX_NEW_TOKENS)
+    return HuggingFacePipeline(pipeline=pipe), _model_bytes(model), peak
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget=MODEL_MEMORY_BUDGET, idle_seconds=MODEL_IDLE_SECONDS, loader=load_pipeline):
+        self.memory_budget = memory_budget
+        self.idle_seconds = idle_seconds
+        self.loader = loader
+        # (model_id, precision) -> entry, least recently used first
+        self._models = OrderedDict()
+        self._load_locks = {}  # (model_id, precision) -> lock held while that model loads
+        # (model_id, precision) -> peak bytes while loading, remembered after eviction to make room before a reload
+        self._peaks = {}
+        self._lock = threading.Lock()
+        self._sweeper_started = False
+        self._prewarmed = set()
+        self.loads = 0
+        self.evictions = 0
+
+    def _key(self, model_id, precision):
+        model_id = model_id or DEFAULT_LOCAL_MODEL
+        precision = precision or LOCAL_MODEL_PRECISION
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown model precision {precision!r}; expected one of {', '.join(PRECISIONS)}")
+        return model_id, precision
+
+    def _acquire(self, key):
+        with self._lock:
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        # Concurrent requests for a model that is loading wait for that load instead of starting another.
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    self._models.move_to_end(key)
+                    entry["in_use"] += 1
+                    entry["uses"] += 1
+                    return entry
+                evicted = self._evict(needed=self._peaks.get(key, 0))
+            self._release_memory(evicted)
+            entry = self._load(key)
+            with self._lock:
+                self._models[key] = entry
+                self._peaks[key] = entry["peak_bytes"]
+                self.loads += 1
+                evicted = self._evict()
+            self._release_memory(evicted)
+            self._start_sweeper()
+            return entry
+
+    def _load(self, key):
+        model_id, precision = key
+        rss_before = _rss()
+        start = time.perf_counter()
+        with metrics.span("model_load", model=model_id, precision=precision):
+            llm, nbytes, peak = self.loader(model_id, precision)
+        seconds = time.perf_counter() - start
+        rss_after = _rss()
+        llm_logger.info(
+            f"Loaded local model {model_id} ({precision}) in {seconds:.1f}s, {nbytes / 1024 ** 3:.2f} GB of weights"
+            + (f" ({peak / 1024 ** 3:.2f} GB while loading)" if peak > nbytes else "")
+        )
+        if nbytes > self.memory_budget:
+            error_logger.error(
+                f"Local model {model_id} ({precision}) needs {nbytes / 1024 ** 3:.2f} GB, "
+                f"more than the {self.memory_budget / 1024 ** 3:.2f} GB model memory budget"
+            )
+        now = time.monotonic()
+        return {
+            "model": model_id,
+            "precision": precision,
+            "llm": llm,
+            "bytes": nbytes,
+            "peak_bytes": max(peak, nbytes),
+            "rss_bytes": rss_after - rss_before if rss_before is not None else None,
+            "load_seconds": seconds,
+            "loaded_at": time.time(),
+            "last_used": now,
+            "in_use": 1,
+            "uses": 1,
+        }
+
+    def _evict(self, needed=0):
+        """Called with the lock held: drop idle models, then least recently used ones until `needed` more bytes fit.
+
+        Models in use by a running query are never evicted.
+        """
+        now = time.monotonic()
+        evicted = []
+        total = sum(entry["bytes"] for entry in self._models.values())
+        for key, entry in list(self._models.items()):
+            if entry["in_use"]:
+                continue
+            idle = now - entry["last_used"] > self.idle_seconds
+            if idle or total + needed > self.memory_budget:
+                evicted.append(self._models.pop(key))
+                total -= entry["bytes"]
+                self.evictions += 1
+                reason = "idle" if idle else "over memory budget"
+                llm_logger.info(f"Evicted local model {entry['model']} ({entry['precision']}): {reason}")
+        return evicted
+
+    def _release_memory(self, evicted):
+        if evicted:
+            evicted.clear()
+            gc.collect()
+
+    def _start_sweeper(self):
+        with self._lock:
+            if self._sweeper_started:
+                return
+            self._sweeper_started = True
+
+        def sweep():
+            while True:
+                time.sleep(IDLE_CHECK_INTERVAL)
+                with self._lock:
+                    evicted = self._evict()
+                self._release_memory(evicted)
+
+        threading.Thread(target=sweep, name="model-registry-sweeper", daemon=True).start()
+
+    @contextmanager
+    def use(self, model_id=None, precision=None):
+        """Yield the shared pipeline for a model, loading it on first use; it cannot be evicted inside the block."""
+        key = self._key(model_id, precision)
+        entry = self._acquire(key)
+        try:
+            yield entry["llm"]
+        finally:
+            with self._lock:
+                entry["in_use"] -= 1
+                entry["last_used"] = time.monotonic()
+
+    def get(self, model_id=None, precision=None):
+        """Return the shared pipeline for a model without pinning it; prefer use() around generation."""
+        with self.use(model_id, precision) as llm:
+            return llm
+
+    def prewarm(self, model_id=None, precision=None):
+        """Load a model in a background thread so the first question does not wait for it. Only the first call per model loads."""
+        key = self._key(model_id, precision)
+        with self._lock:
+            if key in self._prewarmed:
+                return
+            self._prewarmed.add(key)
+
+        def load():
+            try:
+                with self.use(*key):
+                    pass
+            except Exception as e:
+                error_logger.error(f"Error pre-warming local model {key[0]}: {e}")
+
+        threading.Thread(target=load, name="model-prewarm", daemon=True).start()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            models = [
+                {
+                    "model": entry["model"],
+                    "precision": entry["precision"],
+                    "load_seconds": round(entry["load_seconds"], 2),
+                    "bytes": entry["bytes"],
+                    "rss_bytes": entry["rss_bytes"],
+                    "uses": entry["uses"],
+                    "in_use": entry["in_use"],
+                    "idle_seconds": round(now - entry["last_used"], 1),
+                }
+                for entry in self._models.values()
+            ]
+        return {
+            "models": models,
+            "loaded_bytes": sum(m["bytes"] for m in models),
+            "memory_budget": self.memory_budget,
+            "loads": self.loads,
+            "evictions": self.evictions,
+        }
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,151 @@
+# parse_cache.py
+# Content-addressed cache for parsed documents, keyed by a hash of the file bytes plus the parser version.
+# Tables live in the memory-mapped table store; PDF text is kept in an in-memory LRU bounded by a byte budget, backed by gzip files on disk.
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from logic.logging_config import get_logger
+from logic.table_store import table_store
+
+# Bump whenever parsing logic changes so stale cache entries are ignored.
+PARSER_VERSION = "3"
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'parsed')
+MEMORY_BUDGET_BYTES = 512 * 1024 * 1024
+
+upload_logger = get_logger('upload_logger', 'upload')
+error_logger = get_logger('error_logger', 'errors')
+
+
+def read_file_bytes(file):
+    """Return the raw bytes of an uploaded file without consuming it."""
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
+    position = file.tell()
+    data = file.read()
+    file.seek(position)
+    return data
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def cache_key(data, filename):
+    ext = os.path.splitext(filename)[-1].lower().lstrip(".")
+    return f"{content_hash(data)}-{ext}-v{PARSER_VERSION}"
+
+
+def estimate_size(content):
+    if isinstance(content, pd.DataFrame):
+        return int(content.memory_usage(index=True, deep=True).sum())
+    if isinstance(content, str):
+        return len(content.encode("utf-8"))
+    return 0
+
+
+class ParseCache:
+    def __init__(self, cache_dir=CACHE_DIR, memory_budget=MEMORY_BUDGET_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self._entries = OrderedDict()  # key -> (content, size)
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        table = table_store.open(key)
+        if table is not None:
+            # Mapped tables are file-backed pages, not heap memory, so they stay out of the LRU budget.
+            with self._lock:
+                self.hits += 1
+            return table
+        content = self._load_from_disk(key)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, content)
+        return content
+
+    def put(self, key, content):
+        """Store parsed content and return the copy callers should keep (the memory-mapped one for tables)."""
+        if content is None:
+            return None
+        if isinstance(content, pd.DataFrame) and table_store.save(key, content):
+            mapped = table_store.open(key)
+            if mapped is not None:
+                return mapped
+        self._remember(key, content)
+        self._save_to_disk(key, content)
+        return content
+
+    def _remember(self, key, content):
+        size = estimate_size(content)
+        if size > self.memory_budget:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._memory_used -= self._entries.pop(key)[1]
+            self._entries[key] = (content, size)
+            self._memory_used += size
+            while self._memory_used > self.memory_budget and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._memory_used -= evicted_size
+
+    def _load_from_disk(self, key):
+        text_path = self._path(key, ".txt.gz")
+        try:
+            if os.path.exists(text_path):
+                upload_logger.info(f"Parse cache disk hit: {key}")
+                with gzip.open(text_path, "rt", encoding="utf-8") as f:
+                    return f.read()
+        except Exception as e:
+            error_logger.error(f"Error reading parse cache entry {key}: {e}")
+        return None
+
+    def _save_to_disk(self, key, content):
+        try:
+            if not isinstance(content, str):
+                # Tables the table store could not write (e.g. mixed-type columns) are kept in memory only.
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key, ".txt.gz")
+            with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+                f.write(content)
+            # Atomic rename so concurrent readers never see a partial file.
+            os.replace(path + ".tmp", path)
+        except Exception as e:
+            error_logger.error(f"Error writing parse cache entry {key}: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_used,
+                "memory_budget": self.memory_budget,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "mapped_bytes": table_store.mapped_bytes(),
+            }
+
+
+parse_cache = ParseCache()
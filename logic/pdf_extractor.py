@@ -0,0 +1,110 @@
+# pdf_extractor.py
+# Parallel, page-streaming PDF text extraction built on pdfplumber.
+# Fans page ranges out to a process pool and yields page text in order, so callers can report progress or start work early.
+
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfplumber
+
+from logic.logging_config import get_logger, init_worker_logging, worker_log_queue
+
+MAX_WORKERS = os.cpu_count() or 1
+PAGES_PER_TASK = 8
+# Below this many pages the cost of starting worker processes outweighs the speed-up.
+MIN_PAGES_FOR_POOL = 16
+MAX_PAGES = 5000
+MAX_TEXT_BYTES = 100 * 1024 * 1024
+
+upload_logger = get_logger('upload_logger', 'upload')
+
+_worker_pdf_bytes = None
+
+
+def _init_worker(data, log_queue):
+    # Each worker receives the PDF bytes once instead of once per task.
+    global _worker_pdf_bytes
+    _worker_pdf_bytes = data
+    init_worker_logging(log_queue)
+
+
+def _extract_pages(pdf, start, stop):
+    texts = []
+    for i in range(start, stop):
+        page = pdf.pages[i]
+        # Image-only pages return None.
+        texts.append(page.extract_text() or "")
+        page.close()
+    return texts
+
+
+def _extract_page_range(start, stop):
+    with pdfplumber.open(io.BytesIO(_worker_pdf_bytes)) as pdf:
+        return _extract_pages(pdf, start, stop)
+
+
+def count_pages(data):
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        return len(pdf.pages)
+
+
+def _iter_serial(data, total):
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        for i in range(total):
+            yield _extract_pages(pdf, i, i + 1)[0]
+
+
+def _iter_parallel(data, total, workers):
+    ranges = [(start, min(start + PAGES_PER_TASK, total)) for start in range(0, total, PAGES_PER_TASK)]
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data, worker_log_queue()))
+    try:
+        # Keep a bounded number of ranges in flight so a slow consumer does not buffer the whole document.
+        pending = []
+        next_range = 0
+        while next_range < len(ranges) and len(pending) < workers * 2:
+            pending.append(executor.submit(_extract_page_range, *ranges[next_range]))
+            next_range += 1
+        while pending:
+            texts = pending.pop(0).result()
+            if next_range < len(ranges):
+                pending.append(executor.submit(_extract_page_range, *ranges[next_range]))
+                next_range += 1
+            yield from texts
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_pdf_pages(data, max_pages=MAX_PAGES, max_bytes=MAX_TEXT_BYTES, workers=MAX_WORKERS):
+    """Yield (page_index, page_count, text) for each page of a PDF, in page order.
+
+    Stops after max_pages pages or once max_bytes of text have been produced.
+    """
+    total = count_pages(data)
+    if max_pages is not None and total > max_pages:
+        upload_logger.warning(f"PDF has {total} pages; extracting only the first {max_pages}")
+        total = max_pages
+    if workers and workers > 1 and total >= MIN_PAGES_FOR_POOL:
+        pages = _iter_parallel(data, total, min(workers, -(-total // PAGES_PER_TASK)))
+    else:
+        pages = _iter_serial(data, total)
+    produced = 0
+    try:
+        for index, text in enumerate(pages):
+            yield index, total, text
+            produced += len(text.encode("utf-8"))
+            if max_bytes is not None and produced >= max_bytes and index + 1 < total:
+                upload_logger.warning(f"PDF text limit of {max_bytes} bytes reached after {index + 1} of {total} pages")
+                return
+    finally:
+        pages.close()
+
+
+def extract_pdf_text(data, max_pages=MAX_PAGES, max_bytes=MAX_TEXT_BYTES, on_page=None):
+    """Extract the text of a PDF, one line break after each page. on_page(done, total) is called as pages complete."""
+    texts = []
+    for index, total, text in iter_pdf_pages(data, max_pages=max_pages, max_bytes=max_bytes):
+        texts.append(text)
+        if on_page:
+            on_page(index + 1, total)
+    return "".join(text + "\n" for text in texts)
@@ -0,0 +1,132 @@
+# retrieval.py
+# Chunk-level hybrid retrieval over uploaded documents: FAISS vector search and BM25 keyword search, fused by reciprocal rank.
+# Each document is indexed once at upload; each question gets only the top-k chunks that fit in a token budget.
+
+import pandas as pd
+
+from chatbot.table_context import format_rows
+from logic.bm25 import BM25Index, reciprocal_rank_fusion
+from logic.langchain_pipeline import split_documents
+from logic.logging_config import get_logger
+from logic.metrics import metrics
+from logic.text_utils import estimate_tokens
+
+TOP_K = 8
+CONTEXT_TOKEN_BUDGET = 3000
+TABLE_ROWS_PER_CHUNK = 20
+# Extra candidates fetched so chunks from removed documents can be filtered out.
+FETCH_MULTIPLIER = 4
+# Reciprocal rank fusion constant: higher values flatten the advantage of top-ranked results in either list.
+RRF_K = 60
+# Keyword hits scoring below this share of the best hit only matched common terms (e.g. a column name in every chunk).
+# Left in, they would reach the top by appearing in both lists and push an exact identifier match out of the top-k.
+KEYWORD_MIN_RELATIVE_SCORE = 0.5
+
+user_actions_logger = get_logger('user_actions_logger', 'user_actions')
+
+
+def chunk_content(filename, content, doc_hash=None):
+    """Split parsed content into chunk Documents tagged with their source file and content hash."""
+    from langchain_core.documents import Document
+
+    if isinstance(content, pd.DataFrame):
+        docs = []
+        for start in range(0, len(content), TABLE_ROWS_PER_CHUNK):
+            rows = content.iloc[start:start + TABLE_ROWS_PER_CHUNK]
+            # Every table chunk repeats the header so it can be read on its own.
+            docs.append(Document(page_content=format_rows(rows), metadata={"source": filename}))
+    elif isinstance(content, str) and content.strip():
+        docs = split_documents([Document(page_content=content, metadata={"source": filename})])
+    else:
+        return []
+    for i, doc in enumerate(docs):
+        doc.metadata["chunk"] = i
+        doc.metadata["doc_hash"] = doc_hash
+    return docs
+
+
+def build_context(chunks):
+    return "\n".join(
+        f"\n--- {chunk.metadata['source']} (chunk {chunk.metadata['chunk']}) ---\n{chunk.page_content}"
+        for chunk in chunks
+    )
+
+
+class DocumentIndex:
+    """Vector index over the chunks of every document uploaded in a session.
+
+    Per-document indexes come from the shared index store, so only documents never seen before are embedded.
+    """
+
+    def __init__(self):
+        self.vectorstore = None
+        self.keywords = BM25Index()
+        self.filenames = {}  # doc_hash -> filename
+
+    @property
+    def sources(self):
+        return set(self.filenames.values())
+
+    def add_document(self, filename, content, doc_hash):
+        if doc_hash in self.filenames:
+            self.filenames[doc_hash] = filename
+            return
+        # FAISS and the embedding model are loaded with the first indexed document, not at startup.
+        from logic.embedding import merge_faiss_stores
+        from logic.index_store import index_store, clone_store
+
+        store = index_store.get_or_build(doc_hash, lambda: chunk_content(filename, content, doc_hash))
+        if store is None:
+            return
+        # Work on a copy so the per-document index shared with other sessions is never mutated.
+        store = clone_store(store)
+        if self.vectorstore is None:
+            self.vectorstore = store
+        else:
+            merge_faiss_stores(self.vectorstore, store)
+        # Only the new document's postings are added; the merged index is never rebuilt.
+        keywords = index_store.keyword_index(doc_hash)
+        if keywords is not None:
+            self.keywords.merge_from(keywords)
+        self.filenames[doc_hash] = filename
+
+    def search(self, question, k):
+        """Return up to k (chunk, fused score) pairs ranked by reciprocal rank fusion of vector and keyword search."""
+        dense = self.vectorstore.similarity_search_with_score(question, k=k)
+        sparse = self.keywords.search(question, k=k)
+        sparse = [(doc_id, score) for doc_id, score in sparse if score >= sparse[0][1] * KEYWORD_MIN_RELATIVE_SCORE]
+        by_id = {doc.id: doc for doc, _ in dense}
+        fused = reciprocal_rank_fusion([[doc.id for doc, _ in dense], [doc_id for doc_id, _ in sparse]], k=RRF_K)
+        results = []
+        for doc_id, score in fused[:k]:
+            # Chunks found only by keyword are fetched from the docstore the vector index shares.
+            doc = by_id.get(doc_id) or self.vectorstore.docstore.search(doc_id)
+            if not isinstance(doc, str):  # InMemoryDocstore returns an error string for unknown ids
+                results.append((doc, score))
+        return results
+
+    def retrieve(self, question, sources=None, top_k=TOP_K, token_budget=CONTEXT_TOKEN_BUDGET):
+        """Return (chunk, score) pairs for the best chunks that together fit within token_budget."""
+        if self.vectorstore is None:
+            return []
+        from langchain_core.documents import Document
+
+        with metrics.span("retrieve"):
+            results = self.search(question, k=top_k * FETCH_MULTIPLIER)
+        selected = []
+        used_tokens = 0
+        for doc, score in results:
+            # Indexes are shared between sessions, so report the filename used in this one.
+            filename = self.filenames.get(doc.metadata.get("doc_hash"), doc.metadata.get("source"))
+            if sources is not None and filename not in sources:
+                continue
+            tokens = estimate_tokens(doc.page_content)
+            if used_tokens + tokens > token_budget:
+                continue
+            chunk = Document(page_content=doc.page_content, metadata={**doc.metadata, "source": filename})
+            selected.append((chunk, score))
+            used_tokens += tokens
+            if len(selected) >= top_k:
+                break
+        user_actions_logger.info(f"Retrieved {len(selected)} chunks ({used_tokens} tokens) for query: '{question}'")
+        return selected
@@ -0,0 +1,79 @@
+# startup_profile.py
+# Reports the import time and memory cost of starting DocQuery Agent, and of each feature that loads its heavy
+# dependencies on first use. Run with: python app.py --profile-startup (exits non-zero if startup loads a heavy module).
+
+import importlib
+import sys
+import time
+
+# Imported at startup, then in the order a session typically first needs each lazily loaded feature.
+PROFILE_STAGES = [
+    ("startup", ["ui.streamlit_ui"]),
+    ("pdf parsing", ["logic.pdf_extractor"]),
+    ("retrieval index", ["langchain_core.documents", "langchain_text_splitters", "logic.index_store"]),
+    ("document loaders", ["langchain_community.document_loaders"]),
+    ("local LLM pipeline", ["langchain_huggingface", "transformers"]),
+]
+# Packages that must not be imported just to show the first page.
+HEAVY_MODULES = (
+    "torch", "transformers", "sentence_transformers", "langchain_huggingface", "faiss",
+    "langchain_core", "langchain_community", "langchain_text_splitters", "pdfplumber",
+)
+
+
+def _rss():
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except Exception:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, in KB on Linux
+
+
+def _top_level(modules):
+    return {name.split(".", 1)[0] for name in modules}
+
+
+def profile_stages(stages=PROFILE_STAGES):
+    """Import each stage's modules in order; return a row per stage with seconds, RSS growth and new heavy packages."""
+    rows = []
+    _rss()  # load psutil before the first measurement
+    for stage, modules in stages:
+        before = set(sys.modules)
+        rss_before = _rss()
+        start = time.perf_counter()
+        error = None
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except Exception as e:
+                error = f"{module}: {type(e).__name__}: {e}"
+                break
+        seconds = time.perf_counter() - start
+        loaded = set(sys.modules) - before
+        rows.append({
+            "stage": stage,
+            "seconds": seconds,
+            "rss_mb": (_rss() - rss_before) / 1024 ** 2,
+            "modules": len(loaded),
+            "heavy": sorted(_top_level(loaded) & set(HEAVY_MODULES)),
+            "error": error,
+        })
+    return rows
+
+
+def main():
+    rows = profile_stages()
+    print(f"{'stage':<20}{'seconds':>9}{'RSS +MB':>9}{'modules':>9}  heavy packages loaded")
+    for row in rows:
+        print(f"{row['stage']:<20}{row['seconds']:>9.2f}{row['rss_mb']:>9.1f}{row['modules']:>9}  "
+              f"{', '.join(row['heavy']) or '-'}")
+        if row["error"]:
+            print(f"{'':<20}unavailable ({row['error']})")
+    startup = rows[0]
+    if startup["error"]:
+        return 1
+    if startup["heavy"]:
+        print(f"Startup imports heavy packages it does not need: {', '.join(startup['heavy'])}")
+        return 1
+    return 0
@@ -0,0 +1,89 @@
+# table_store.py
+# Columnar storage for parsed tables: each table is written once as an uncompressed Arrow IPC file and opened via memory-mapping.
+# DataFrames opened here are backed by the mapped file, so sessions and processes share one physical copy of each table.
+
+import json
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+from logic.logging_config import get_logger
+
+TABLE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'tables')
+_REPORT_KEY = b"load_report"
+
+error_logger = get_logger('error_logger', 'errors')
+
+
+def _string_types(arrow_type):
+    # Arrow strings become pyarrow-backed pandas strings, which wrap the mapped buffers without copying.
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return pd.StringDtype("pyarrow")
+    return None
+
+
+class TableStore:
+    def __init__(self, table_dir=TABLE_DIR):
+        self.table_dir = table_dir
+        self._open = {}  # key -> DataFrame, shared by every session in this process
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.table_dir, key + ".arrow")
+
+    def contains(self, key):
+        return os.path.exists(self.path(key))
+
+    def save(self, key, df):
+        """Write df as an Arrow IPC file. Returns False if the table cannot be represented in Arrow."""
+        path = self.path(key)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            report = df.attrs.get("load_report")
+            if report is not None:
+                metadata = dict(table.schema.metadata or {})
+                metadata[_REPORT_KEY] = json.dumps(report).encode("utf-8")
+                table = table.replace_schema_metadata(metadata)
+            os.makedirs(self.table_dir, exist_ok=True)
+            # Uncompressed, so the file can be mapped and read without decoding.
+            with pa.OSFile(path + ".tmp", "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(path + ".tmp", path)
+            return True
+        except Exception as e:
+            error_logger.error(f"Error writing table {key}: {e}")
+            return False
+
+    def open(self, key):
+        """Return a DataFrame backed by the memory-mapped table file, or None if it is not stored."""
+        with self._lock:
+            df = self._open.get(key)
+            if df is not None:
+                return df
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+            # split_blocks keeps each numeric column as its own zero-copy view instead of consolidating into new blocks.
+            df = table.to_pandas(split_blocks=True, types_mapper=_string_types)
+            metadata = table.schema.metadata or {}
+            if _REPORT_KEY in metadata:
+                df.attrs["load_report"] = json.loads(metadata[_REPORT_KEY])
+        except Exception as e:
+            error_logger.error(f"Error opening table {key}: {e}")
+            return None
+        with self._lock:
+            df = self._open.setdefault(key, df)
+        return df
+
+    def mapped_bytes(self):
+        with self._lock:
+            keys = list(self._open)
+        return sum(os.path.getsize(self.path(key)) for key in keys if os.path.exists(self.path(key)))
+
+
+table_store = TableStore()
@@ -0,0 +1,10 @@
+# text_utils.py
+# Small helpers shared by the context-building code, such as a cheap token estimate for prompt budgeting.
+# Used to keep prompts sent to the LLM within a configured size.
+
+# Rough average for English text with Llama-style tokenizers.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
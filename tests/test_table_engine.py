@@ -0,0 +1,32 @@
+# test_table_engine.py
+# Checks that invoice questions are answered from the column they ask about, or left to the LLM.
+
+import pandas as pd
+import pytest
+
+from chatbot.table_engine import answer_table_question
+
+
+@pytest.fixture
+def invoice():
+    return pd.DataFrame({"Item": ["Pen", "Notebook", "Eraser"], "Qty": [100, 2, 3], "Unit Price": [10, 40, 5]})
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What is the total quantity?", "The total quantity is 105 across 3 items."),
+    ("Which item has the highest quantity?", "The highest quantity is Pen with 100."),
+    ("what is the qty of pen", "Pen: quantity 100"),
+    ("what is the price of pen", "Pen: 10"),
+    ("What is the total amount?", "The total amount is 1,095 across 3 items."),
+    ("Which item is the most expensive?", "The most expensive item is Notebook at 40."),
+    ("Which is the cheapest item?", "The cheapest item is Eraser at 5."),
+])
+def test_invoice_answers_use_the_asked_column(invoice, question, expected):
+    assert answer_table_question(question, invoice, "invoice") == expected
+
+
+def test_invoice_question_about_other_column_goes_to_llm(invoice):
+    invoice["Tax Rate"] = [5, 5, 12]
+    assert answer_table_question("what is the tax rate of pen", invoice, "invoice") is None
+    assert answer_table_question("What is the total amount?", invoice, "invoice") == \
+        "The total amount is 1,095 across 3 items."
@@ -1,16 +1,168 @@
+from uuid import uuid4
+
 import streamlit as st
 import pandas as pd
 
-from logic.agent_controller import process_file, handle_query, handle_uploaded_file, route_query
-from logic.langchain_pipeline import load_document, detect_document_type, create_vectorstore, build_qa_chain
+from logic.agent_controller import handle_query_stream, fan_out_query
+from logic.archive import is_archive
+from logic.ingestion import ingestion_queue, FINISHED, FAILED
+from logic.retrieval import DocumentIndex, build_context, CONTEXT_TOKEN_BUDGET, TOP_K
+from logic.parse_cache import content_hash, read_file_bytes
+from chatbot.table_engine import answer_table_question
+from chatbot.table_context import build_table_context
 from ui.system_info import system_info_tab
 from chatbot.ollama_interface import get_available_models_with_fallback
+from logic.metrics import metrics, start_exporters
+from logic.logging_config import log_context, session_id_var
+from logic.model_registry import model_registry, PREWARM_LOCAL_MODEL
 
 session_key_data = "parsed_data"
 session_key_chat = "chat_history"
+session_key_index = "doc_index"
+session_key_jobs = "ingest_jobs"
+session_key_finished = "ingest_finished"
+
+
+@st.fragment(run_every=1.0)
+def ingestion_status(job_ids, finished_count):
+    """Show progress for files still being ingested; rerun the page when another file finishes."""
+    jobs = ingestion_queue.statuses(ingestion_queue.expand(job_ids))
+    if sum(job["status"] in FINISHED for job in jobs) > finished_count:
+        st.rerun()
+    for job in ingestion_queue.statuses(job_ids):
+        if job.get("kind") == "archive":
+            # One bar per archive rather than one per member.
+            members = ingestion_queue.statuses(job["members"])
+            ready = sum(member["status"] in FINISHED for member in members)
+            if job["status"] not in FINISHED or ready < len(members):
+                reading = "reading archive, " if job["status"] not in FINISHED else ""
+                st.progress(ready / len(members) if members else 0.0,
+                            text=f"{job['filename']}: {reading}{ready} of {len(members)} documents ready...")
+        elif job["status"] not in FINISHED:
+            st.progress(job["progress"], text=f"{job['filename']}: {job['status']}...")
+
+
+def _session_job(finished, job_id):
+    job = finished.get(job_id)
+    if job is None:
+        job = ingestion_queue.status(job_id)
+        if job is not None and job["status"] in FINISHED:
+            # The session keeps the parsed content from here on; the queue is shared by every session.
+            finished[job_id] = job
+            ingestion_queue.release(job_id)
+    return job
+
+
+def session_jobs(job_ids):
+    """Statuses of the jobs and their archive members, with finished jobs taken into session state."""
+    finished = st.session_state.setdefault(session_key_finished, {})  # job id -> finished job, content included
+    jobs = []
+    for job_id in job_ids:
+        job = _session_job(finished, job_id)
+        if job is None:
+            continue
+        jobs.append(job)
+        if job.get("kind") == "archive":
+            jobs.extend(member for member in (_session_job(finished, m) for m in job["members"]) if member is not None)
+    return jobs
+
+
+def answer_with_llm(user_input, all_contents, top_k, token_budget, semantic_cache):
+    """Answer from retrieved chunks (or the full documents) with the selected model, rendering the streamed reply."""
+    doc_index = st.session_state.get(session_key_index)
+    retrieved = []
+    with metrics.span("context_build", kind="documents"):
+        if doc_index is not None and doc_index.vectorstore is not None:
+            try:
+                retrieved = doc_index.retrieve(
+                    user_input,
+                    sources={info["filename"] for info in all_contents},
+                    top_k=top_k,
+                    token_budget=token_budget,
+                )
+            except Exception as e:
+                st.warning(f"Retrieval failed, using full document context: {e}")
+        if retrieved:
+            context_for_llm = build_context([chunk for chunk, _ in retrieved])
+        else:
+            # Fall back to combining all document contents (tables and text) for the chatbot
+            combined_context = []
+            table_budget = token_budget // max(1, len(all_contents))
+            for info in all_contents:
+                if isinstance(info["content"], pd.DataFrame):
+                    table_context = build_table_context(info["content"], user_input, token_budget=table_budget)
+                    combined_context.append(f"\n--- {info['filename']} (table) ---\n{table_context}")
+                elif isinstance(info["content"], str):
+                    combined_context.append(f"\n--- {info['filename']} ---\n{info['content']}")
+            context_for_llm = "\n".join(combined_context)
+    if context_for_llm.strip():
+        try:
+            # Semantic cache hits are scoped to the set of documents, not the exact retrieved chunks.
+            scope = "|".join(sorted(info["doc_hash"] for info in all_contents))
+            response = st.write_stream(
+                handle_query_stream(
+                    user_input,
+                    context_for_llm,
+                    model=st.session_state['selected_model'],
+                    scope=scope,
+                    semantic_cache=semantic_cache,
+                )
+            )
+        except Exception as e:
+            response = f"Sorry, there was an error processing your question: {e}"
+            st.markdown(response)
+        # Ambiguous query handler
+        if (isinstance(response, str) and ("couldn't find" in response or "generic response" in response)) or not response.strip():
+            hint = "\n\nIf this answer is not helpful, please clarify your question or specify which document you are referring to."
+            st.markdown(hint)
+            response += hint
+    else:
+        response = "No valid document content to answer from."
+        st.markdown(response)
+    if retrieved:
+        with st.expander(f"📚 Sources used ({len(retrieved)} chunks)"):
+            for chunk, score in retrieved:
+                st.markdown(f"**{chunk.metadata['source']}** — chunk {chunk.metadata['chunk']} (fused relevance {score:.3f})")
+                st.text(chunk.page_content[:500])
+    return response
+
+
+def fan_out_answer(user_input, all_contents, top_k, token_budget, semantic_cache):
+    """Answer each relevant document separately and concurrently, rendering the merged, attributed reply."""
+    documents = all_contents
+    doc_index = st.session_state.get(session_key_index)
+    if doc_index is not None and doc_index.vectorstore is not None:
+        try:
+            retrieved = doc_index.retrieve(
+                user_input,
+                sources={info["filename"] for info in all_contents},
+                top_k=top_k,
+                token_budget=token_budget,
+            )
+            # Only documents with a retrieved chunk are asked; if nothing was retrieved, every document is.
+            relevant = {chunk.metadata["source"] for chunk, _ in retrieved}
+            documents = [info for info in all_contents if info["filename"] in relevant] or all_contents
+        except Exception as e:
+            st.warning(f"Retrieval failed, asking every document: {e}")
+    with st.spinner(f"Asking {len(documents)} document(s)..."):
+        response, results = fan_out_query(
+            user_input, documents, model=st.session_state['selected_model'], semantic_cache=semantic_cache
+        )
+    st.markdown(response)
+    with st.expander(f"📚 Per-document answers ({len(results)})"):
+        for result in results:
+            seconds = f"{result['seconds']:.1f}s" if result["seconds"] is not None else "—"
+            st.markdown(f"**{result['filename']}** — {result['status'].replace('_', ' ')} ({seconds})")
+            if result["answer"]:
+                st.text(result["answer"][:500])
+    return response
 
 
 def run_app():
+    start_exporters()
+    if PREWARM_LOCAL_MODEL:
+        model_registry.prewarm()
+    session_id_var.set(st.session_state.setdefault("session_id", uuid4().hex[:12]))
     st.title("📄 DocQuery AI Agent")
     tab1, tab2 = st.tabs(["Upload Documents", "System Info"])
     with tab1:
@@ -26,42 +178,78 @@ def run_app():
         )
         st.session_state['selected_model'] = selected_model
 
-        uploaded_files = st.file_uploader("Upload documents", type=["pdf", "csv", "txt"], accept_multiple_files=True)
+        uploaded_files = st.file_uploader("Upload documents", type=["pdf", "csv", "xlsx", "txt", "zip"], accept_multiple_files=True)
 
         doc_infos = []  # List of (doc_type, content, filename)
         if uploaded_files:
+            # Files are parsed, classified and indexed in the background; documents are usable as soon as their job is done.
+            jobs = st.session_state.setdefault(session_key_jobs, {})  # (filename, doc_hash) -> job id
+            job_ids = []
             for uploaded_file in uploaded_files:
-                try:
-                    doc_type, content = handle_uploaded_file(uploaded_file)
-                except Exception as e:
-                    st.error(f"Error parsing {uploaded_file.name}: {e}")
-                    doc_type, content = "unsupported", None
-                # Empty content handler
-                if (isinstance(content, pd.DataFrame) and content.empty) or (isinstance(content, str) and not content.strip()):
-                    st.warning(f"{uploaded_file.name} was parsed but contains no usable content.")
-                    doc_type = "empty"
-                    content = None
+                data = read_file_bytes(uploaded_file)
+                job_key = (uploaded_file.name, content_hash(data))
+                if job_key not in jobs:
+                    # Archives are read member by member; each member becomes a job of its own.
+                    submit = ingestion_queue.submit_archive if is_archive(uploaded_file.name) else ingestion_queue.submit
+                    jobs[job_key] = submit(data, uploaded_file.name)
+                job_ids.append(jobs[job_key])
+            statuses = session_jobs(job_ids)
+            finished = [job for job in statuses if job["status"] in FINISHED]
+            if len(finished) < len(statuses):
+                ingestion_status(job_ids, len(finished))
+            archive_notes = []
+            for job in finished:
+                if job.get("kind") == "archive" and job["status"] != FAILED:
+                    for member, reason in job["skipped"]:
+                        if reason == "unsupported file type":
+                            doc_infos.append({"doc_type": "unsupported", "content": None, "filename": f"{job['filename']}/{member}",
+                                              "doc_hash": None, "error": None})
+                        else:
+                            archive_notes.append(f"{member} ({reason})")
+                    continue
                 doc_infos.append({
-                    "doc_type": doc_type,
-                    "content": content,
-                    "filename": uploaded_file.name
+                    "doc_type": "error" if job["status"] == FAILED else job["doc_type"],
+                    "content": job["content"],
+                    "filename": job["filename"],
+                    "doc_hash": job["doc_hash"],
+                    "error": job["error"] if job["status"] == FAILED else None,
                 })
             st.session_state[session_key_data] = doc_infos
 
-            st.success(f"{len(doc_infos)} document(s) uploaded.")
+            # Index each document once; reruns only embed files that were not seen before.
+            if session_key_index not in st.session_state:
+                st.session_state[session_key_index] = DocumentIndex()
+            doc_index = st.session_state[session_key_index]
+            for info in doc_infos:
+                if info["content"] is None or doc_index.filenames.get(info["doc_hash"]) == info["filename"]:
+                    continue
+                try:
+                    doc_index.add_document(info["filename"], info["content"], info["doc_hash"])
+                except Exception as e:
+                    st.warning(f"Could not index {info['filename']} for retrieval: {e}")
+
+            pending = len(statuses) - len(finished)
+            st.success(f"{len(doc_infos)} document(s) ready" + (f", {pending} still processing." if pending else "."))
+            if archive_notes:
+                st.caption("Skipped in archives: " + ", ".join(archive_notes))
             for info in doc_infos:
                 st.markdown(f"**{info['filename']}** detected as: `{info['doc_type']}`")
                 if info["doc_type"] == "unsupported":
-                    st.error(f"{info['filename']} is an unsupported file type. Supported: PDF, CSV, TXT.")
+                    st.error(f"{info['filename']} is an unsupported file type. Supported: PDF, CSV, XLSX, TXT, ZIP.")
                 elif info["doc_type"] == "empty":
                     st.warning(f"{info['filename']} is empty and will be skipped.")
                 elif info["content"] is None:
+                    if info["error"]:
+                        st.error(f"Could not process {info['filename']}: {info['error']}")
                     st.warning(f"Could not parse {info['filename']}. Please review or process this file manually.")
-                    st.download_button(
-                        label=f"Download {info['filename']}",
-                        data=next((f for f in uploaded_files if f.name == info['filename']), None),
-                        file_name=info['filename']
-                    )
+                    original = next((f for f in uploaded_files if f.name == info['filename']), None)
+                    # Archive members have no upload of their own to download.
+                    if original is not None:
+                        st.download_button(
+                            label=f"Download {info['filename']}",
+                            data=original,
+                            file_name=info['filename']
+                        )
                 elif info["doc_type"] == "unknown":
                     st.warning(f"{info['filename']} was not automatically detected. Please assign a type manually.")
                     manual_type_key = f"manual_type_{info['filename']}"
@@ -98,6 +286,15 @@ def run_app():
                             st.rerun()
                 elif isinstance(info["content"], pd.DataFrame):
                     with st.expander(f"🔍 Preview Table: {info['filename']}"):
+                        report = info["content"].attrs.get("load_report")
+                        if report:
+                            st.caption(
+                                f"{report['rows_loaded']:,} of {report['rows_total']:,} rows loaded, "
+                                f"{report['memory_bytes'] / (1024**2):.1f} MB in memory"
+                            )
+                            if report["sampled"]:
+                                st.info("This table exceeds the load limit; answers use a random sample plus full-file column totals.")
+                                st.dataframe(pd.DataFrame(report["summary"]).T, use_container_width=True)
                         st.dataframe(info["content"], use_container_width=True)
                 elif isinstance(info["content"], str):
                     with st.expander(f"📄 Preview Text: {info['filename']}"):
@@ -112,6 +309,15 @@ def run_app():
         if session_key_chat not in st.session_state:
             st.session_state[session_key_chat] = []
 
+        with st.expander("⚙️ Retrieval settings"):
+            top_k = st.slider("Chunks per question (top-k)", 1, 20, TOP_K, key="retrieval_top_k")
+            token_budget = st.slider("Context token budget", 500, 16000, CONTEXT_TOKEN_BUDGET, step=500, key="retrieval_token_budget")
+            semantic_cache = st.toggle("Reuse cached answers for similar questions", value=False, key="semantic_answer_cache")
+            fan_out = st.toggle(
+                "Answer each document separately", value=False, key="fan_out_mode",
+                help="Ask every relevant document in parallel and list differing answers by file.",
+            )
+
         # User input and clear chat button
         col1, col2 = st.columns([4, 1])
         with col1:
@@ -132,36 +338,34 @@ def run_app():
             if session_key_data not in st.session_state or not st.session_state[session_key_data]:
                 st.warning("⚠️ Please upload and process at least one document first.")
             else:
-                st.session_state[session_key_chat].append({"role": "user", "content": user_input})
-                with st.chat_message("user"):
-                    st.markdown(user_input)
-
-                # Combine all document contents (tables and text) for the chatbot
-                all_contents = st.session_state[session_key_data]
-                combined_context = []
-                from tabulate import tabulate
-                for info in all_contents:
-                    if info["doc_type"] in ["empty", "unsupported"]:
-                        continue
-                    if isinstance(info["content"], pd.DataFrame):
-                        table_md = tabulate(info["content"], headers="keys", tablefmt="pipe", showindex=False)
-                        combined_context.append(f"\n--- {info['filename']} (table) ---\n{table_md}")
-                    elif isinstance(info["content"], str):
-                        combined_context.append(f"\n--- {info['filename']} ---\n{info['content']}")
-                # Join all document contexts for the LLM
-                context_for_llm = "\n".join(combined_context)
-                if context_for_llm.strip():
-                    try:
-                        response = handle_query(user_input, context_for_llm, model=st.session_state['selected_model'])
-                    except Exception as e:
-                        response = f"Sorry, there was an error processing your question: {e}"
-                    # Ambiguous query handler
-                    if (isinstance(response, str) and ("couldn't find" in response or "generic response" in response)) or not response.strip():
-                        response += "\n\nIf this answer is not helpful, please clarify your question or specify which document you are referring to."
-                else:
-                    response = "No valid document content to answer from."
-                with st.chat_message("assistant"):
-                    st.markdown(response)
+                # Every log record written while answering carries this request ID.
+                with log_context(request_id=uuid4().hex[:12]):
+                    st.session_state[session_key_chat].append({"role": "user", "content": user_input})
+                    with st.chat_message("user"):
+                        st.markdown(user_input)
+
+                    all_contents = [
+                        info for info in st.session_state[session_key_data]
+                        if info["doc_type"] not in ["empty", "unsupported"] and info["content"] is not None
+                    ]
+                    # Aggregate and filter questions on attendance/invoice tables are computed exactly with pandas;
+                    # only open-ended questions go to the LLM.
+                    table_answers = []
+                    for info in all_contents:
+                        if isinstance(info["content"], pd.DataFrame):
+                            table_answer = answer_table_question(user_input, info["content"], info["doc_type"])
+                            if table_answer is not None:
+                                table_answers.append(f"**{info['filename']}**: {table_answer}")
+                    if table_answers:
+                        response = "\n\n".join(table_answers)
+                        with st.chat_message("assistant"):
+                            st.markdown(response)
+                    elif fan_out and len(all_contents) > 1:
+                        with st.chat_message("assistant"):
+                            response = fan_out_answer(user_input, all_contents, top_k, token_budget, semantic_cache)
+                    else:
+                        with st.chat_message("assistant"):
+                            response = answer_with_llm(user_input, all_contents, top_k, token_budget, semantic_cache)
                     st.session_state[session_key_chat].append({"role": "assistant", "content": response})
     with tab2:
         system_info_tab()
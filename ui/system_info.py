@@ -1,6 +1,17 @@
 import streamlit as st
-import shutil
-import os
+import pandas as pd
+import json
+from datetime import datetime
+
+from chatbot.answer_cache import answer_cache
+from chatbot.circuit_breaker import breakers
+from chatbot.ollama_client import get_client
+from logic.logging_config import LOG_FILES, tail_log
+from logic.metrics import metrics
+from logic.model_registry import model_registry
+from logic.parse_cache import parse_cache
+
+METRICS_REFRESH_SECONDS = 5
 
 def get_live_system_resources():
     try:
@@ -40,6 +51,55 @@ def get_live_system_resources():
     }
 
 
+def _format_log_line(line):
+    # Older log files contain plain text lines; newer ones are JSON records.
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return line
+    ids = " ".join(f"{key}={entry[key]}" for key in ("session_id", "request_id") if entry.get(key))
+    return f"{entry['time']} {entry['level']} {entry['message']}" + (f" [{ids}]" if ids else "")
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def metrics_panel():
+    st.subheader("Pipeline Metrics")
+    histograms = metrics.histograms()
+    stages = [h for h in histograms if h["name"] == "stage_seconds"]
+    if not stages:
+        st.info("No pipeline activity yet.")
+    else:
+        st.dataframe(pd.DataFrame([
+            {
+                "stage": h["labels"].get("stage"),
+                "labels": ", ".join(f"{k}={v}" for k, v in h["labels"].items() if k != "stage"),
+                "count": h["count"],
+                "mean ms": _ms(h["sum"] / h["count"]),
+                "p50 ms": _ms(h["p50"]),
+                "p95 ms": _ms(h["p95"]),
+                "total s": round(h["sum"], 2),
+            }
+            for h in stages
+        ]), use_container_width=True, hide_index=True)
+    for h in histograms:
+        if h["name"] == "prompt_tokens":
+            st.write(f"**Prompt Size:** {h['count']} prompts, mean {h['sum'] / h['count']:.0f} tokens, "
+                     f"p50 {h['p50']:.0f}, p95 {h['p95']:.0f}")
+        elif h["name"] == "llm_first_token_seconds":
+            st.write(f"**Time to First Token ({h['labels']['model']}):** p50 {_ms(h['p50'])} ms, p95 {_ms(h['p95'])} ms")
+    counters = metrics.counters()
+    if counters:
+        st.dataframe(pd.DataFrame([
+            {"counter": c["name"], "labels": ", ".join(f"{k}={v}" for k, v in c["labels"].items()), "value": c["value"]}
+            for c in counters
+        ]), use_container_width=True, hide_index=True)
+    st.download_button("Download metrics (Prometheus format)", metrics.render_prometheus(),
+                       file_name="docquery_metrics.prom", mime="text/plain")
+
+
 def system_info_tab():
     st.header("System Information")
     # Live/Static toggle
@@ -67,23 +127,69 @@ def system_info_tab():
     if stats['cpu_freq']:
         st.write(f"**CPU Frequency:** {stats['cpu_freq']:.0f} MHz")
 
+    st.subheader("Caches")
+    answers = answer_cache.stats()
+    st.write(f"**Answer Cache:** {answers['entries']} entries, hit rate {answers['hit_rate']:.0%} "
+             f"({answers['exact_hits']} exact, {answers['semantic_hits']} semantic, {answers['misses']} misses)")
+    parsed = parse_cache.stats()
+    st.write(f"**Parse Cache:** {parsed['entries']} entries, {parsed['memory_bytes'] / (1024**2):.1f} MB in memory, "
+             f"{parsed['mapped_bytes'] / (1024**2):.1f} MB of tables memory-mapped ({parsed['hits']} memory hits, {parsed['disk_hits']} disk hits, {parsed['misses']} misses)")
+
+    local = model_registry.stats()
+    if local["models"] or local["loads"]:
+        st.subheader("Local Models")
+        st.write(f"**Loaded:** {local['loaded_bytes'] / (1024**3):.2f} GB of {local['memory_budget'] / (1024**3):.0f} GB budget "
+                 f"({local['loads']} loads, {local['evictions']} evictions)")
+        if local["models"]:
+            st.dataframe(pd.DataFrame([
+                {
+                    "model": m["model"],
+                    "precision": m["precision"],
+                    "load s": m["load_seconds"],
+                    "weights GB": round(m["bytes"] / (1024**3), 2),
+                    "RSS +GB": round(m["rss_bytes"] / (1024**3), 2) if m["rss_bytes"] is not None else None,
+                    "uses": m["uses"],
+                    "idle s": m["idle_seconds"],
+                }
+                for m in local["models"]
+            ]), use_container_width=True, hide_index=True)
+
+    # Refreshes on its own while live stats are on, without rerunning the rest of the page.
+    st.fragment(metrics_panel, run_every=METRICS_REFRESH_SECONDS if live else None)()
+
     st.subheader("Circuit Breaker Status")
-    st.write("**Failure Count:** 0")
-    st.write("**Threshold:** 5")
-    st.write("**Last Failure:** None")
+    snapshots = breakers.snapshots()
+    if not snapshots:
+        st.info("No model calls yet.")
+    for snap in snapshots:
+        def fmt(seconds):
+            return f"{seconds:.2f}s" if seconds is not None else "n/a"
+        state_icon = {"closed": "🟢", "half-open": "🟡", "open": "🔴"}[snap["state"]]
+        st.write(f"{state_icon} **{snap['model']}** — {snap['state']}")
+        st.write(f"**Failure Count:** {snap['failure_count']} / **Threshold:** {snap['threshold']} "
+                 f"({snap['successes']} ok, {snap['failures']} failed in total)")
+        if snap["last_failure"]:
+            failed_at, message = snap["last_failure"]
+            st.write(f"**Last Failure:** {datetime.fromtimestamp(failed_at):%Y-%m-%d %H:%M:%S} — {message}")
+        else:
+            st.write("**Last Failure:** None")
+        st.write(f"**Latency:** p50 {fmt(snap['p50'])}, p95 {fmt(snap['p95'])}, p99 {fmt(snap['p99'])}")
 
     st.subheader("Available Models")
-    st.write("• llama3:latest")
-
-    st.subheader("llama Status")
-    st.success("✅ llama is available")
+    client = get_client()
+    models = client.get_models()
+    if models:
+        for name in models:
+            st.write(f"• {name}")
+        st.success(f"✅ Ollama is available at {client.base_url}")
+    else:
+        st.error(f"❌ Ollama is not reachable at {client.base_url} or has no models installed")
 
     # --- Recent Logs Section ---
     st.subheader("Recent Logs")
-    log_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs", "errors.log")
-    if os.path.exists(log_path):
-        with open(log_path, "r") as f:
-            lines = f.readlines()[-20:]
-        st.code("".join(lines), language="text")
+    log_type = st.selectbox("Log", list(LOG_FILES), index=list(LOG_FILES).index("errors"), key="log_viewer_type")
+    lines = tail_log(log_type, lines=20)
+    if lines:
+        st.code("\n".join(_format_log_line(line) for line in lines), language="text")
     else:
-        st.info("No error logs found.")
+        st.info(f"No {log_type} logs found.")